@@ -1,16 +1,49 @@
 import os
+import json
+import time
 import asyncio
+import inspect
 import multiprocessing
 import logging
 import fcntl
+from queue import Full
 from pathlib import Path
 from dotenv import load_dotenv
+from telegram import Update
 from telegram.ext import Application
 from telegram.ext import ApplicationBuilder
-from handlers.admin import setup_admin_handlers
+from handlers.admin import setup_admin_handlers, prune_expired_warnings
 from handlers.group import setup_group_handlers
 from handlers.info import setup_info_handler
-from handlers.web_server import run_web_server
+from handlers.debug import setup_debug_handler
+from handlers.flood import setup_flood_handler
+from handlers.web_server import (
+    run_web_server,
+    attach_application,
+    create_embedded_server,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    METRICS_FILE
+)
+from utils.metrics import (
+    instrument_handlers,
+    register_application_metrics,
+    monitor_event_loop_lag,
+    export_metrics_file,
+    Counter,
+    Gauge
+)
+from utils.rate_limiter import OutboundScheduler, OUTBOUND_GLOBAL_PER_SECOND, OUTBOUND_OTHER_PER_SECOND
+from utils.update_recorder import (
+    setup_update_recorder,
+    open_update_log,
+    write_update,
+    close_update_log,
+    UPDATE_LOG_PATH
+)
+from utils.update_processor import ChatOrderedApplication, UPDATE_CONCURRENCY
+from utils.sharding import SHARD_COUNT, set_shard, shard_for_update, shard_lock_path
+from utils import timers
 
 # Load environment variables
 load_dotenv()
@@ -22,52 +55,136 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def prevent_multiple_instances():
-    """Ensure only one bot instance runs at a time"""
-    lockfile = Path("bot_instance.lock")
+# "polling" (default) or "webhook"; webhook mode serves the web app in-process
+UPDATE_MODE = os.getenv("UPDATE_MODE", "polling").lower()
+# "process" runs uvicorn in a child process; "embedded" serves it on the bot's loop
+WEB_SERVER_MODE = os.getenv("WEB_SERVER_MODE", "process").lower()
+EMBED_WEB_SERVER = UPDATE_MODE == "webhook" or WEB_SERVER_MODE == "embedded"
+# Alternative Bot API server, e.g. a local one or benchmarks/fake_api_server.py
+TELEGRAM_BASE_URL = os.getenv("TELEGRAM_BASE_URL", "").rstrip("/")
+# Updates buffered per shard; beyond it the dispatcher drops them
+SHARD_QUEUE_SIZE = int(os.getenv("SHARD_QUEUE_SIZE", "10000"))
+SHARD_CHECK_INTERVAL = 5  # Seconds between shard worker liveness checks
+SHARD_MIN_UPTIME = 60  # A worker dying sooner after (re)start stops the bot
+
+SHARD_UPDATES_DROPPED = Counter(
+    "ironcore_shard_updates_dropped_total", "Updates dropped because a shard's queue was full",
+    ("shard",)
+)
+SHARD_RESTARTS = Counter("ironcore_shard_restarts_total", "Shard workers restarted after dying", ("shard",))
+_SHARDS_FAILED = object()  # Put on the dispatcher's queue when workers can't be kept alive
+
+def prevent_multiple_instances(lockfile: Path = Path("bot_instance.lock")):
+    """Ensure only one process holds `lockfile` (the bot, or one shard of it)"""
     try:
         lockfile.touch(exist_ok=True)
         lockfile_fd = os.open(lockfile, os.O_WRONLY)
         fcntl.flock(lockfile_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
         return lockfile_fd
     except (IOError, BlockingIOError):
-        logger.error("Another bot instance is already running")
+        logger.error(f"Another bot instance already holds {lockfile}")
         raise SystemExit(1)
     except Exception as e:
         logger.error(f"Failed to create lockfile: {e}")
         raise SystemExit(1)
 
-async def main():
-    """Main application entry point"""
-    # Initialize database first
-    from database.database import init_db
-    init_db()
+def release_lock(lock_fd: int, lockfile: Path = Path("bot_instance.lock")):
+    os.close(lock_fd)
+    lockfile.unlink(missing_ok=True)
 
-    # Build application with conflict prevention
-    app = (
+async def run_cleanup(steps: list):
+    """Run each (name, callable) shutdown step, even if earlier ones fail"""
+    for name, step in steps:
+        try:
+            result = step()
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            logger.error(f"Shutdown step '{name}' failed: {e}")
+
+async def set_webhook(app: Application):
+    """Point Telegram at our FastAPI webhook endpoint"""
+    if not WEBHOOK_SECRET:
+        raise RuntimeError("WEBHOOK_SECRET must be set in webhook mode")
+    webhook_url = os.getenv("WEBHOOK_URL")
+    if not webhook_url:
+        raise RuntimeError("WEBHOOK_URL must be set in webhook mode")
+    await app.bot.set_webhook(
+        url=webhook_url.rstrip("/") + WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=Update.ALL_TYPES,
+        max_connections=int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+    )
+    logger.info("Receiving updates via webhook on %s", WEBHOOK_PATH)
+
+async def start_receiving(app: Application):
+    """Start the webhook or long polling, feeding app.update_queue"""
+    if UPDATE_MODE == "webhook":
+        await set_webhook(app)
+    else:
+        await app.updater.start_polling(
+            bootstrap_retries=-1,
+            timeout=30,
+            read_timeout=30,
+            allowed_updates=Update.ALL_TYPES  # chat_member updates keep caches fresh
+        )
+
+def build_application(rate_limiter=None) -> Application:
+    builder = (
         ApplicationBuilder()
         .token(os.getenv("BOT_TOKEN"))
-        .concurrent_updates(True)
+        .application_class(ChatOrderedApplication)
+        .concurrent_updates(UPDATE_CONCURRENCY)
         .http_version("1.1")
         .get_updates_http_version("1.1")
-        .build()
     )
-    
-    # Setup handlers
+    if rate_limiter is not None:
+        builder = builder.rate_limiter(rate_limiter)
+    if TELEGRAM_BASE_URL:
+        builder = builder.base_url(f"{TELEGRAM_BASE_URL}/bot").base_file_url(f"{TELEGRAM_BASE_URL}/file/bot")
+    return builder.build()
+
+def setup_handlers(app: Application):
     setup_group_handlers(app)
     setup_admin_handlers(app)
     setup_info_handler(app)
+    setup_debug_handler(app)
+    setup_flood_handler(app)
+    instrument_handlers(app)
+    register_application_metrics(app)
+
+async def main():
+    """Main application entry point"""
+    # Initialize database first
+    from database.database import init_db, close_db
+    from database import async_db
+    init_db()
+    async_db.start()
+
+    # Build application with conflict prevention
+    app = build_application(OutboundScheduler())
+    
+    # Setup handlers
+    setup_handlers(app)
+    setup_update_recorder(app)
     
     logger.info("Starting bot in %s environment", os.getenv("ENVIRONMENT"))
     
     try:
         await app.initialize()
         await app.start()
-        await app.updater.start_polling(
-            bootstrap_retries=-1,
-            timeout=30,
-            read_timeout=30
-        )
+        timers.start(app.bot)  # Reloads jobs persisted before a restart
+        if EMBED_WEB_SERVER:
+            attach_application(app)
+            web_server = create_embedded_server()
+            web_server_task = asyncio.create_task(web_server.serve())
+        await start_receiving(app)
+        background_tasks = [
+            asyncio.create_task(prune_expired_warnings()),
+            asyncio.create_task(monitor_event_loop_lag())
+        ]
+        if not EMBED_WEB_SERVER:
+            background_tasks.append(asyncio.create_task(export_metrics_file(METRICS_FILE)))
         
         # Keep alive
         while True:
@@ -76,25 +193,211 @@ async def main():
     except Exception as e:
         logger.error(f"Bot crashed: {e}")
     finally:
-        if hasattr(app, 'updater') and app.updater.running:
-            await app.updater.stop()
-        if hasattr(app, 'running') and app.running:
-            await app.stop()
+        for task in locals().get('background_tasks', []):
+            task.cancel()
+        steps = []
+        if 'web_server' in locals():
+            web_server.should_exit = True
+            steps.append(("web server", lambda: web_server_task))
+        await run_cleanup(steps + [
+            ("timers", timers.stop),
+            ("updater", lambda: app.updater.stop() if app.updater and app.updater.running else None),
+            ("application", lambda: app.stop() if app.running else None),
+            ("async db", async_db.stop),
+            ("database", close_db),
+            ("update log", close_update_log),
+        ])
+
+async def worker_main(index: int, queue):
+    """Shard worker: runs every handler for the chats routed to it"""
+    from database.database import init_db, close_db
+    from database import async_db
+    set_shard(index)
+    init_db()
+    async_db.start()
+
+    # Shards share the bot token, so they split its global send budget
+    app = build_application(OutboundScheduler(
+        global_per_second=OUTBOUND_GLOBAL_PER_SECOND / SHARD_COUNT,
+        other_per_second=OUTBOUND_OTHER_PER_SECOND / SHARD_COUNT
+    ))
+    setup_handlers(app)
+    loop = asyncio.get_running_loop()
+
+    try:
+        await app.initialize()
+        await app.start()
+        timers.start(app.bot)  # Only this shard's jobs
+        background_tasks = [
+            asyncio.create_task(monitor_event_loop_lag()),
+            asyncio.create_task(export_metrics_file(f"{METRICS_FILE}.shard{index}"))
+        ]
+        if index == 0:
+            background_tasks.append(asyncio.create_task(prune_expired_warnings()))
+        logger.info(f"Shard {index}/{SHARD_COUNT} ready")
+
+        while True:
+            data = await loop.run_in_executor(None, queue.get)
+            if data is None:  # Dispatcher is shutting down
+                break
+            await app.update_queue.put(Update.de_json(json.loads(data), app.bot))
+
+    except Exception as e:
+        logger.error(f"Shard {index} crashed: {e}")
+    finally:
+        for task in locals().get('background_tasks', []):
+            task.cancel()
+        await run_cleanup([
+            ("timers", timers.stop),
+            ("application", lambda: app.stop() if app.running else None),
+            ("application shutdown", app.shutdown),
+            ("async db", async_db.stop),
+            ("database", close_db),
+        ])
+
+def run_shard(index: int, queue):
+    """Worker process entry point"""
+    lockfile = shard_lock_path(index)
+    lock_fd = prevent_multiple_instances(lockfile)
+    try:
+        asyncio.run(worker_main(index, queue))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        release_lock(lock_fd, lockfile)
+
+async def watch_shards(workers: list, start_worker, dropped: list):
+    """Restart dead shard workers and report dropped updates.
+
+    Returns once a worker dies within SHARD_MIN_UPTIME of its (re)start.
+    """
+    started = [time.monotonic()] * len(workers)
+    reported = list(dropped)
+    while True:
+        await asyncio.sleep(SHARD_CHECK_INTERVAL)
+        for index, worker in enumerate(workers):
+            if dropped[index] != reported[index]:
+                logger.warning(
+                    f"Shard {index} queue full: dropped {dropped[index] - reported[index]} updates"
+                )
+                reported[index] = dropped[index]
+            if worker.is_alive():
+                continue
+            if time.monotonic() - started[index] < SHARD_MIN_UPTIME:
+                logger.critical(
+                    f"{worker.name} exited with code {worker.exitcode} "
+                    f"within {SHARD_MIN_UPTIME}s of starting; giving up"
+                )
+                return
+            logger.error(f"{worker.name} died with exit code {worker.exitcode}; restarting it")
+            SHARD_RESTARTS.inc(str(index))
+            workers[index] = start_worker(index)
+            started[index] = time.monotonic()
+
+async def dispatcher_main(queues: list, workers: list, start_worker):
+    """Front process: receives updates and routes each chat to its shard"""
+    app = build_application()  # Never started: we drain update_queue ourselves
+    Gauge(
+        "ironcore_shard_queue_depth", "Updates waiting to be picked up by each shard",
+        lambda: {(str(index),): queue.qsize() for index, queue in enumerate(queues)},
+        ("shard",)
+    )
+    if UPDATE_LOG_PATH:
+        open_update_log(UPDATE_LOG_PATH)
+
+    logger.info("Dispatching to %d shards in %s environment", SHARD_COUNT, os.getenv("ENVIRONMENT"))
+
+    try:
+        await app.initialize()
+        if EMBED_WEB_SERVER:
+            attach_application(app)
+            web_server = create_embedded_server()
+            web_server_task = asyncio.create_task(web_server.serve())
+        await start_receiving(app)
+        dropped = [0] * len(queues)
+        watcher = asyncio.create_task(watch_shards(workers, start_worker, dropped))
+        # Wakes the loop below if the workers can't be kept alive
+        watcher.add_done_callback(lambda _: app.update_queue.put_nowait(_SHARDS_FAILED))
+        background_tasks = [watcher, asyncio.create_task(monitor_event_loop_lag())]
+        if not EMBED_WEB_SERVER:
+            background_tasks.append(asyncio.create_task(export_metrics_file(f"{METRICS_FILE}.dispatcher")))
+
+        while True:
+            update = await app.update_queue.get()
+            if update is _SHARDS_FAILED:
+                raise RuntimeError("shard workers keep dying")
+            write_update(update)
+            shard = shard_for_update(update)
+            try:
+                queues[shard].put_nowait(update.to_json())
+            except Full:
+                dropped[shard] += 1
+                SHARD_UPDATES_DROPPED.inc(str(shard))
+
+    except Exception as e:
+        logger.error(f"Dispatcher crashed: {e}")
+        raise SystemExit(1)
+    finally:
+        for task in locals().get('background_tasks', []):
+            task.cancel()
+        steps = []
+        if 'web_server' in locals():
+            web_server.should_exit = True
+            steps.append(("web server", lambda: web_server_task))
+        await run_cleanup(steps + [
+            ("updater", lambda: app.updater.stop() if app.updater.running else None),
+            ("application shutdown", app.shutdown),
+            ("update log", close_update_log),
+        ])
+
+def run_sharded():
+    """Start SHARD_COUNT worker processes and dispatch to them from this one"""
+    context = multiprocessing.get_context("spawn")
+    queues = [None] * SHARD_COUNT
+
+    def start_worker(index: int):
+        # A worker killed inside queue.get() keeps the queue's read lock, so each
+        # start gets a fresh queue; updates left in a dead worker's queue are lost
+        queues[index] = context.Queue(maxsize=SHARD_QUEUE_SIZE)
+        worker = context.Process(
+            target=run_shard, args=(index, queues[index]), name=f"shard-{index}", daemon=True
+        )
+        worker.start()
+        return worker
+
+    workers = [start_worker(index) for index in range(SHARD_COUNT)]
+    try:
+        asyncio.run(dispatcher_main(queues, workers, start_worker))
+    finally:
+        for queue, worker in zip(queues, workers):
+            try:
+                queue.put(None, timeout=5 if worker.is_alive() else 0)
+            except Full:
+                pass  # Terminated below if it doesn't stop
+        for worker in workers:
+            worker.join(timeout=30)
+            if worker.is_alive():
+                logger.warning(f"{worker.name} did not stop in time; terminating")
+                worker.terminate()
 
 if __name__ == "__main__":
     # Prevent multiple instances
     lock_fd = prevent_multiple_instances()
     
     try:
-        # Start web server
-        web_process = multiprocessing.Process(
-            target=run_web_server,
-            daemon=True
-        )
-        web_process.start()
+        # Start web server (embedded mode runs it inside the bot's loop instead)
+        if not EMBED_WEB_SERVER:
+            web_process = multiprocessing.Process(
+                target=run_web_server,
+                daemon=True
+            )
+            web_process.start()
         
         # Run bot
-        asyncio.run(main())
+        if SHARD_COUNT > 1:
+            run_sharded()
+        else:
+            asyncio.run(main())
     except KeyboardInterrupt:
         logger.info("Shutting down gracefully...")
     except Exception as e:
@@ -106,7 +409,6 @@ if __name__ == "__main__":
                 web_process.terminate()
                 web_process.join()
             if 'lock_fd' in locals():
-                os.close(lock_fd)
-                Path("bot_instance.lock").unlink(missing_ok=True)
+                release_lock(lock_fd)
         except Exception as e:
             logger.error(f"Cleanup error: {e}")
@@ -0,0 +1,90 @@
+"""Measure event-loop lag during a synthetic join flood.
+
+Compares the old pattern (sync sqlite calls inside coroutines) with the
+async database API. Run from the repository root:
+
+    python -m benchmarks.event_loop_lag --joins 5000 --chats 50
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import statistics
+from pathlib import Path
+
+TICK = 0.005  # Probe interval in seconds
+
+async def probe_lag(samples: list, stop: asyncio.Event):
+    """Record how late the loop wakes up for a fixed-interval sleep"""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(TICK)
+        samples.append(loop.time() - started - TICK)
+
+async def flood(store, joins: int, chats: int, concurrency: int):
+    """Fire join events at the store function with bounded concurrency"""
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with sem:
+            await store(-1000 - i % chats, i)
+
+    await asyncio.gather(*(one(i) for i in range(joins)))
+
+async def run(label: str, store, args) -> dict:
+    samples = []
+    stop = asyncio.Event()
+    prober = asyncio.create_task(probe_lag(samples, stop))
+    await asyncio.sleep(TICK * 2)
+    started = time.perf_counter()
+    await flood(store, args.joins, args.chats, args.concurrency)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await prober
+    samples.sort()
+    return {
+        "mode": label,
+        "joins/s": args.joins / elapsed,
+        "lag p50 ms": statistics.median(samples) * 1000,
+        "lag p99 ms": samples[int(len(samples) * 0.99) - 1] * 1000,
+        "lag max ms": samples[-1] * 1000,
+        "probes": len(samples),
+    }
+
+async def main(args):
+    from database import database, async_db
+
+    database.init_db()
+
+    async def sync_store(chat_id, user_id):
+        database.store_join_date(chat_id, user_id)
+
+    results = [await run("sync (before)", sync_store, args)]
+    async_db.start()
+    results.append(await run("async_db (after)", async_db.store_join_date, args))
+    await async_db.stop()
+    database.close_db()
+
+    for result in results:
+        print(
+            f"{result['mode']:<18} {result['joins/s']:>9.0f} joins/s  "
+            f"lag p50 {result['lag p50 ms']:6.2f} ms  "
+            f"p99 {result['lag p99 ms']:7.2f} ms  "
+            f"max {result['lag max ms']:7.2f} ms  "
+            f"({result['probes']} probes)"
+        )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--joins", type=int, default=5000)
+    parser.add_argument("--chats", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=256)
+    args = parser.parse_args()
+
+    # Keep the benchmark database away from the real bot_data.db
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    os.chdir(tempfile.mkdtemp(prefix="ironcore-bench-"))
+    asyncio.run(main(args))
@@ -0,0 +1,270 @@
+"""Local stand-in for the Telegram Bot API to load-test the whole bot.
+
+Serves getUpdates (long polling), sendMessage, getChatAdministrators,
+getChatMember, restrictChatMember, banChatMember and friends over HTTP,
+feeds a scripted update stream and reports throughput and response latency.
+Latency of an update is measured from the moment it becomes available to
+getUpdates until the bot's first API call answering it (a reply to the
+message, or the welcome/goodbye sent to its chat).
+
+Run it next to a bot pointed at it with TELEGRAM_BASE_URL, or let it spawn
+IRonCore.py itself. From the repository root:
+
+    python -m benchmarks.fake_api_server --scenario join_flood --updates 2000 --run-bot
+    python -m benchmarks.fake_api_server --scenario command_storm --latency 0.05 --error-rate 0.02
+"""
+import os
+import sys
+import time
+import random
+import signal
+import asyncio
+import argparse
+import tempfile
+import itertools
+import statistics
+import subprocess
+from pathlib import Path
+from collections import Counter, defaultdict, deque
+from urllib.parse import parse_qsl
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from starlette.requests import ClientDisconnect
+from benchmarks.fake_bot import api_result, message_update, join_update, leave_update, command_update
+from benchmarks.update_latency import free_port
+
+TOKEN = "123456:loadtest"
+FIRST_USER = 100_000
+# Methods that count as the bot answering an update
+ANSWER_METHODS = {"sendMessage", "restrictChatMember", "banChatMember", "unbanChatMember"}
+
+class FakeTelegramServer:
+    """Bot API over HTTP with injectable latency and 429 responses"""
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, retry_after: int = 1):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.pending = deque()
+        self.arrived = asyncio.Event()
+        self.calls = Counter()
+        self.injected_429 = 0
+        self.published_at = {}  # message_id -> time the update became fetchable
+        self.unanswered_events = defaultdict(deque)  # chat_id -> join/leave message ids
+        self.latencies = []
+        self.first_published = self.last_answer = None
+        self._message_ids = itertools.count(10_000_000)
+        self.app = FastAPI()
+        self.app.post("/bot{token}/{method}")(self.handle)
+
+    def publish(self, update: dict):
+        """Make an update available to getUpdates"""
+        message = update["message"]
+        now = time.perf_counter()
+        self.first_published = self.first_published or now
+        if "new_chat_members" in message or "left_chat_member" in message:
+            self.unanswered_events[message["chat"]["id"]].append(message["message_id"])
+            self.published_at[message["message_id"]] = now
+        elif message.get("text", "").startswith("/"):
+            self.published_at[message["message_id"]] = now
+        self.pending.append(update)
+        self.arrived.set()
+
+    def record_answer(self, method: str, params: dict):
+        if method not in ANSWER_METHODS:
+            return
+        now = time.perf_counter()
+        answered = []
+        if "reply_to_message_id" in params:
+            answered.append(int(params["reply_to_message_id"]))
+        elif method == "sendMessage":
+            # Welcomes and goodbyes don't quote; they answer every pending event in the chat
+            events = self.unanswered_events.pop(int(params.get("chat_id", 0)), ())
+            answered.extend(events)
+        for message_id in answered:
+            published = self.published_at.pop(message_id, None)
+            if published is not None:
+                self.latencies.append(now - published)
+                self.last_answer = now
+
+    async def handle(self, token: str, method: str, request: Request):
+        try:
+            params = dict(parse_qsl((await request.body()).decode()))
+        except ClientDisconnect:  # Long poll abandoned on shutdown
+            return {"ok": False}
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if method in ANSWER_METHODS and self.error_rate and random.random() < self.error_rate:
+            self.injected_429 += 1
+            return JSONResponse(status_code=429, content={
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after}
+            })
+        if method == "getUpdates":
+            return {"ok": True, "result": await self.get_updates(params)}
+        self.record_answer(method, params)
+        return {"ok": True, "result": api_result(method, params, self._message_ids)}
+
+    async def get_updates(self, params: dict) -> list:
+        offset = int(params.get("offset", 0))
+        while self.pending and self.pending[0]["update_id"] < offset:
+            self.pending.popleft()
+        if not self.pending:
+            self.arrived.clear()
+            try:
+                await asyncio.wait_for(self.arrived.wait(), float(params.get("timeout", 0)))
+            except asyncio.TimeoutError:
+                return []
+        return list(itertools.islice(self.pending, int(params.get("limit", 100))))
+
+# Scenarios: each yields raw update dicts; `users` already joined during warm-up
+
+def join_flood(count: int, chats: int, users: int):
+    for i in range(count):
+        yield join_update(-1000 - i % chats, [FIRST_USER + users + i])
+
+def command_storm(count: int, chats: int, users: int):
+    commands = ("/warn @user{} flooding", "/info @user{}", "/mute @user{} 5m")
+    for i in range(count):
+        user_id = FIRST_USER + i % users
+        chat_id = -1000 - user_id % chats
+        yield command_update(chat_id, commands[i % len(commands)].format(user_id))
+
+def many_chats(count: int, chats: int, users: int):
+    """Chatter, joins, leaves and commands spread over many chats"""
+    for i in range(count):
+        chat_id = -1000 - i % chats
+        kind = i % 10
+        if kind < 6:
+            user_id = FIRST_USER + i % users
+            yield message_update(chat_id, {"id": user_id, "is_bot": False,
+                                           "first_name": f"User{user_id}",
+                                           "username": f"user{user_id}"}, "hello there")
+        elif kind < 8:
+            yield join_update(chat_id, [FIRST_USER + users + i])
+        elif kind == 8:
+            yield leave_update(chat_id, FIRST_USER + users + i - 2)
+        else:
+            yield command_update(chat_id, f"/info @user{FIRST_USER + i % users}")
+
+SCENARIOS = {"join_flood": join_flood, "command_storm": command_storm, "many_chats": many_chats}
+
+def warm_up(chats: int, users: int):
+    """Joins that make the command targets known to the bot's username index"""
+    for i in range(users):
+        user_id = FIRST_USER + i
+        yield join_update(-1000 - user_id % chats, [user_id])
+
+async def feed(server: FakeTelegramServer, updates, rate: float):
+    interval = 1 / rate if rate else 0
+    for update in updates:
+        server.publish(update)
+        if interval:
+            await asyncio.sleep(interval)
+        elif len(server.pending) % 100 == 0:
+            await asyncio.sleep(0)
+
+async def wait_until_answered(server: FakeTelegramServer, idle_timeout: float):
+    """Return once every update is answered or nothing happened for idle_timeout"""
+    last_progress, answered = time.perf_counter(), -1
+    while server.published_at and time.perf_counter() - last_progress < idle_timeout:
+        if len(server.latencies) != answered:
+            answered, last_progress = len(server.latencies), time.perf_counter()
+        await asyncio.sleep(0.1)
+
+def spawn_bot(api_port: int, extra_env: dict) -> subprocess.Popen:
+    """Run IRonCore.py in a scratch directory against the fake API"""
+    env = dict(os.environ)
+    env.update({
+        "BOT_TOKEN": TOKEN,
+        "TELEGRAM_BASE_URL": f"http://127.0.0.1:{api_port}",
+        "WEB_SERVER_MODE": "embedded",
+        "HOST": "127.0.0.1",
+        "PORT": str(free_port()),
+    })
+    env.update(extra_env)
+    return subprocess.Popen(
+        [sys.executable, str(ROOT / "IRonCore.py")],
+        cwd=tempfile.mkdtemp(prefix="ironcore-loadtest-"),
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL if not os.getenv("LOADTEST_BOT_LOGS") else None
+    )
+
+def report(server: FakeTelegramServer, scenario: str, published: int):
+    latencies = sorted(server.latencies)
+    elapsed = (server.last_answer or time.perf_counter()) - server.first_published
+    # Plain chatter expects no answer and is only counted in `published`
+    print(f"scenario {scenario}: {published} updates, {len(latencies)} answered, "
+          f"{len(server.published_at)} unanswered, {elapsed:.2f}s")
+    if latencies:
+        p = lambda q: latencies[max(0, int(len(latencies) * q) - 1)] * 1000
+        print(f"  answered/s {len(latencies) / elapsed:8.1f}")
+        print(f"  latency    p50 {statistics.median(latencies) * 1000:8.1f} ms  "
+              f"p95 {p(0.95):8.1f} ms  p99 {p(0.99):8.1f} ms  max {latencies[-1] * 1000:8.1f} ms")
+    print(f"  429 injected {server.injected_429}")
+    print("  API calls   " + ", ".join(f"{method}={count}" for method, count in server.calls.most_common()))
+
+async def main(args):
+    server = FakeTelegramServer(args.latency, args.error_rate, args.retry_after)
+    port = args.port or free_port()
+    http = uvicorn.Server(uvicorn.Config(server.app, host="127.0.0.1", port=port, log_level="warning"))
+    http.install_signal_handlers = lambda: None
+    http_task = asyncio.create_task(http.serve())
+    while not http.started:
+        await asyncio.sleep(0.01)
+    print(f"Fake Bot API on http://127.0.0.1:{port} (TELEGRAM_BASE_URL), token {TOKEN}")
+
+    bot = None
+    if args.run_bot:
+        bot = spawn_bot(port, dict(item.split("=", 1) for item in args.bot_env))
+    while not server.calls["getUpdates"]:
+        await asyncio.sleep(0.1)  # Wait for the bot to start polling
+
+    if args.scenario != "join_flood":
+        await feed(server, warm_up(args.chats, args.users), 0)
+        await wait_until_answered(server, args.idle_timeout)
+        server.latencies.clear()
+        server.calls.clear()
+        server.injected_429 = 0
+        server.published_at.clear()
+        server.unanswered_events.clear()
+        server.first_published = server.last_answer = None
+
+    updates = list(SCENARIOS[args.scenario](args.updates, args.chats, args.users))
+    await feed(server, updates, args.rate)
+    await wait_until_answered(server, args.idle_timeout)
+    report(server, args.scenario, len(updates))
+
+    if bot is not None:
+        bot.send_signal(signal.SIGINT)
+        bot.wait(timeout=30)
+    http.should_exit = True
+    await http_task
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="many_chats")
+    parser.add_argument("--updates", type=int, default=1000)
+    parser.add_argument("--chats", type=int, default=50, help="Distinct group chats")
+    parser.add_argument("--users", type=int, default=200, help="Known users targeted by commands")
+    parser.add_argument("--rate", type=float, default=0, help="Updates per second (0 = all at once)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Added to every API call (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="Fraction of send/restrict/ban calls answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after of injected 429s")
+    parser.add_argument("--idle-timeout", type=float, default=15,
+                        help="Stop waiting after this long without new answers")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--run-bot", action="store_true", help="Spawn IRonCore.py against the server")
+    parser.add_argument("--bot-env", action="append", default=[], metavar="KEY=VALUE",
+                        help="Extra environment for the spawned bot (repeatable)")
+    asyncio.run(main(parser.parse_args()))
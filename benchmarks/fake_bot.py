@@ -0,0 +1,169 @@
+"""In-process fake Bot API and synthetic Update builders for benchmarks.
+
+FakeTelegramRequest plugs into ApplicationBuilder().request(...), so the real
+telegram.Bot serialisation runs while no network traffic happens. Every call
+is recorded and can be delayed to simulate API latency.
+"""
+import json
+import time
+import asyncio
+import itertools
+from collections import Counter
+from telegram import Update
+from telegram.request import BaseRequest
+from telegram.ext import ApplicationBuilder
+
+BOT_USER = {"id": 777000, "is_bot": True, "first_name": "IRonCore", "username": "ironcore_bot"}
+ADMIN_USER = {"id": 1, "is_bot": False, "first_name": "Admin", "username": "admin"}
+
+def make_user(user_id: int) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}"}
+
+def api_result(endpoint: str, params: dict, message_ids, admin_ids=(), users=None):
+    """Canned "result" for a Bot API method; senders are members unless in admin_ids.
+
+    `users` maps user IDs to user dicts to answer with instead of made-up ones.
+    """
+    users = users or {}
+    if endpoint == "getMe":
+        return BOT_USER
+    if endpoint.startswith("send"):
+        return {
+            "message_id": next(message_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(params.get("chat_id", 0)), "type": "supergroup", "title": "Bench"},
+            "from": BOT_USER,
+            "text": params.get("text", "")
+        }
+    if endpoint == "getChatAdministrators":
+        admins = [{"status": "creator", "user": ADMIN_USER, "is_anonymous": False}]
+        admins.extend(
+            {"status": "administrator", "user": users.get(user_id) or make_user(user_id),
+             "can_be_edited": False,
+             "is_anonymous": False, "can_manage_chat": True, "can_delete_messages": True,
+             "can_manage_video_chats": True, "can_restrict_members": True,
+             "can_promote_members": False, "can_change_info": True, "can_invite_users": True}
+            for user_id in admin_ids
+        )
+        return admins
+    if endpoint == "getChatMember":
+        user_id = int(params["user_id"])
+        user = ADMIN_USER if user_id == ADMIN_USER["id"] else users.get(user_id) or make_user(user_id)
+        return {"status": "member", "user": user}
+    if endpoint == "getUpdates":
+        return []
+    return True
+
+class FakeTelegramRequest(BaseRequest):
+    """Answers Bot API calls from memory, with optional simulated latency"""
+
+    def __init__(self, latency: float = 0.0, admin_ids=(), users=None):
+        self.latency = latency
+        self.admin_ids = set(admin_ids)  # Reported as admins of every chat
+        self.users = users or {}
+        self.calls = Counter()
+        self._message_ids = itertools.count(1)
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        endpoint = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data else {}
+        self.calls[endpoint] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        payload = {"ok": True, "result": self.respond(endpoint, params)}
+        return 200, json.dumps(payload).encode()
+
+    def respond(self, endpoint: str, params: dict):
+        return api_result(endpoint, params, self._message_ids, self.admin_ids, self.users)
+
+def build_application(request: FakeTelegramRequest, rate_limiter=None):
+    """Application wired to the fake API with all of the bot's handlers"""
+    from handlers.admin import setup_admin_handlers
+    from handlers.group import setup_group_handlers
+    from handlers.info import setup_info_handler
+    from handlers.flood import setup_flood_handler
+    from utils.update_processor import ChatOrderedApplication, UPDATE_CONCURRENCY
+    from database.database import init_db
+
+    init_db()  # Schema of the bot_data.db in the current directory
+
+    builder = (
+        ApplicationBuilder()
+        .token("123456:fake")
+        .request(request)
+        .get_updates_request(request)
+        .application_class(ChatOrderedApplication)
+        .concurrent_updates(UPDATE_CONCURRENCY)
+    )
+    if rate_limiter is not None:
+        builder = builder.rate_limiter(rate_limiter)
+    app = builder.build()
+    setup_group_handlers(app)
+    setup_admin_handlers(app)
+    setup_info_handler(app)
+    setup_flood_handler(app)
+    return app
+
+_update_ids = itertools.count(1)
+
+def message_update(chat_id: int, from_user: dict, text: str = None, **extra) -> dict:
+    """Raw update dict for a group message (commands get a bot_command entity)"""
+    update_id = next(_update_ids)
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "supergroup", "title": "Bench"},
+        "from": from_user,
+    }
+    if text is not None:
+        message["text"] = text
+        if text.startswith("/"):
+            message["entities"] = [
+                {"type": "bot_command", "offset": 0, "length": len(text.split()[0])}
+            ]
+    message.update(extra)
+    return {"update_id": update_id, "message": message}
+
+def join_update(chat_id: int, user_ids: list) -> dict:
+    users = [make_user(user_id) for user_id in user_ids]
+    return message_update(chat_id, users[0], new_chat_members=users)
+
+def leave_update(chat_id: int, user_id: int) -> dict:
+    user = make_user(user_id)
+    return message_update(chat_id, user, left_chat_member=user)
+
+def command_update(chat_id: int, text: str) -> dict:
+    return message_update(chat_id, ADMIN_USER, text)
+
+def to_update(data: dict, bot) -> Update:
+    return Update.de_json(data, bot)
+
+def time_handling(app) -> list:
+    """Time every process_update the app runs; returns the list the durations go to
+
+    Updates are meant to be put on app.update_queue, so ChatOrderedApplication
+    orders and limits them as in production; wait with update_queue.join().
+    """
+    durations = []
+    process_update = app.process_update
+
+    async def timed(update):
+        started = time.perf_counter()
+        try:
+            await process_update(update)
+        finally:
+            durations.append(time.perf_counter() - started)
+
+    app.process_update = timed
+    return durations
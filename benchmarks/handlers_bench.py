@@ -0,0 +1,127 @@
+"""Benchmark the real handlers with synthetic Updates and a fake Bot API.
+
+Each scenario puts updates on the Application's update queue, so they run
+through ChatOrderedApplication as in production (get_target_user is called
+directly), and reports throughput, latency percentiles and
+DB/API operations per update. Run from the repository root:
+
+    python -m benchmarks.handlers_bench --updates 1000 --latency 0.002
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import statistics
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("WELCOME_BATCH_WINDOW", "0")
+
+CHAT_ID = -100100
+FIRST_USER = 10_000
+
+def scenarios(count: int) -> dict:
+    """Raw update dicts per scenario, targeting a rotating set of users"""
+    from benchmarks.fake_bot import join_update, leave_update, command_update
+
+    targets = [FIRST_USER + i % 500 for i in range(count)]
+    return {
+        "new_chat_members": [join_update(CHAT_ID, [FIRST_USER + 1000 + i]) for i in range(count)],
+        "left_chat_member": [leave_update(CHAT_ID, FIRST_USER + 1000 + i) for i in range(count)],
+        "warn_user": [command_update(CHAT_ID, f"/warn @user{uid} spam") for uid in targets],
+        "mute_user": [command_update(CHAT_ID, f"/mute @user{uid} 10m") for uid in targets],
+        "user_info": [command_update(CHAT_ID, f"/info @user{uid}") for uid in targets],
+        "get_target_user": [command_update(CHAT_ID, f"/info @user{uid}") for uid in targets],
+    }
+
+async def feed(app, updates: list):
+    """Run updates through the update queue in waves that no chat queue sheds"""
+    from utils.update_processor import CHAT_QUEUE_LIMIT
+
+    wave = max(1, CHAT_QUEUE_LIMIT // 2)  # A join also queues its membership step
+    for start in range(0, len(updates), wave):
+        for update in updates[start:start + wave]:
+            app.update_queue.put_nowait(update)
+        await app.update_queue.join()
+
+async def run_scenario(app, name: str, raw_updates: list, concurrency: int, handled: list) -> dict:
+    from telegram.ext import CallbackContext
+    from benchmarks.fake_bot import to_update
+    from handlers.group import get_target_user
+    from database.database import DB_QUERY_SECONDS
+
+    request = app.bot.request
+    updates = [to_update(data, app.bot) for data in raw_updates]
+    latencies = handled
+    latencies.clear()
+    sem = asyncio.Semaphore(concurrency)
+
+    async def lookup(update):
+        async with sem:
+            started = time.perf_counter()
+            context = CallbackContext.from_update(update, app)
+            context.args = update.message.text.split()[1:]
+            await get_target_user(update, context)
+            latencies.append(time.perf_counter() - started)
+
+    db_before, api_before = DB_QUERY_SECONDS.total_count(), request.total_calls
+    started = time.perf_counter()
+    if name == "get_target_user":
+        await asyncio.gather(*(lookup(update) for update in updates))
+    else:
+        await feed(app, updates)
+    await asyncio.sleep(0.05)  # Let batched welcome tasks flush
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    count = len(updates)
+    return {
+        "scenario": name,
+        "updates/s": count / elapsed,
+        "p50 ms": statistics.median(latencies) * 1000,
+        "p99 ms": latencies[max(0, int(count * 0.99) - 1)] * 1000,
+        "db ops/update": (DB_QUERY_SECONDS.total_count() - db_before) / count,
+        "api calls/update": (request.total_calls - api_before) / count,
+    }
+
+async def main(args):
+    from benchmarks.fake_bot import FakeTelegramRequest, build_application, join_update, time_handling, to_update
+    from database import async_db
+
+    os.environ["UPDATE_CONCURRENCY"] = str(args.concurrency)
+    request = FakeTelegramRequest(latency=args.latency)
+    app = build_application(request)
+    await app.initialize()
+    await app.start()
+
+    # Seed the username index the way real traffic would: targets join first
+    await feed(app, [to_update(join_update(CHAT_ID, [FIRST_USER + i]), app.bot) for i in range(500)])
+    await asyncio.sleep(0.05)
+    handled = time_handling(app)
+
+    selected = args.scenario or list(scenarios(1))
+    all_updates = scenarios(args.updates)
+    print(f"{'scenario':<18} {'updates/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'db ops/upd':>11} {'api/upd':>8}")
+    for name in selected:
+        result = await run_scenario(app, name, all_updates[name], args.concurrency, handled)
+        print(
+            f"{result['scenario']:<18} {result['updates/s']:>10.0f} {result['p50 ms']:>8.2f} "
+            f"{result['p99 ms']:>8.2f} {result['db ops/update']:>11.2f} {result['api calls/update']:>8.2f}"
+        )
+
+    await app.stop()
+    await app.shutdown()
+    await async_db.stop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--updates", type=int, default=1000, help="Updates per scenario")
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated API latency (s)")
+    parser.add_argument("--concurrency", type=int, default=1, help="Updates processed at once (UPDATE_CONCURRENCY)")
+    parser.add_argument("--scenario", action="append",
+                        help="Run only this scenario (repeatable)")
+    args = parser.parse_args()
+    os.chdir(tempfile.mkdtemp(prefix="ironcore-bench-"))
+    asyncio.run(main(args))
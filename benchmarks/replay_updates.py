@@ -0,0 +1,135 @@
+"""Replay a recorded update log against the bot's handlers.
+
+Logs come from running the bot with UPDATE_LOG_PATH set (see
+utils/update_recorder.py). Updates are fed to an Application that has the
+group, admin and info handlers and a fake in-process Bot API, through its
+update queue so per-chat ordering and the concurrency limit apply. They keep
+their recorded spacing divided by --speed; --speed 0 sends them as fast as
+possible. Run from the repository root:
+
+    python -m benchmarks.replay_updates updates.jsonl.gz --speed 10
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import statistics
+from pathlib import Path
+from collections import Counter
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+def command_senders(entries: list) -> set:
+    """Users who sent commands; replayed as chat admins so moderation paths run"""
+    senders = set()
+    for _, data in entries:
+        message = data.get("message") or {}
+        if message.get("text", "").startswith("/") and "from" in message:
+            senders.add(message["from"]["id"])
+    return senders
+
+def recorded_users(entries: list) -> dict:
+    """User dicts seen in the log, so getChatMember answers match the recording"""
+    users = {}
+    def collect(data):
+        if isinstance(data, dict):
+            if "is_bot" in data and "id" in data:
+                users[data["id"]] = data
+            for value in data.values():
+                collect(value)
+        elif isinstance(data, list):
+            for item in data:
+                collect(item)
+    for _, data in entries:
+        collect(data)
+    return users
+
+def traffic_shape(entries: list) -> str:
+    kinds, chats = Counter(), Counter()
+    for _, data in entries:
+        message = data.get("message") or {}
+        if "new_chat_members" in message:
+            kinds["join"] += 1
+        elif "left_chat_member" in message:
+            kinds["leave"] += 1
+        elif message.get("text", "").startswith("/"):
+            kinds[message["text"].split()[0].split("@")[0]] += 1
+        else:
+            kinds[next((key for key in data if key != "update_id"), "other")] += 1
+        if "chat" in message:
+            chats[message["chat"]["id"]] += 1
+    duration = entries[-1][0] - entries[0][0] if entries else 0
+    hot = chats.most_common(1)[0][1] if chats else 0
+    return (f"{len(entries)} updates over {duration:.1f}s recorded, {len(chats)} chats "
+            f"(hottest {hot}), mix: " + ", ".join(f"{k}={v}" for k, v in kinds.most_common(8)))
+
+async def replay(args, entries: list):
+    from benchmarks.fake_bot import FakeTelegramRequest, build_application, time_handling, to_update
+    from database import async_db
+    from database.database import DB_QUERY_SECONDS
+
+    admins = command_senders(entries) if args.admins_from_log else ()
+    request = FakeTelegramRequest(latency=args.latency, admin_ids=admins, users=recorded_users(entries))
+    app = build_application(request)
+    await app.initialize()
+    await app.start()
+
+    durations, slips = time_handling(app), []
+
+    db_before = DB_QUERY_SECONDS.total_count()
+    first_recorded = entries[0][0]
+    started = time.perf_counter()
+    for sent, (recorded_at, data) in enumerate(entries):
+        due = started + ((recorded_at - first_recorded) / args.speed if args.speed else 0)
+        delay = due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        elif sent % 100 == 0:
+            await asyncio.sleep(0)
+        slips.append(max(0.0, time.perf_counter() - due))
+        app.update_queue.put_nowait(to_update(data, app.bot))
+    await app.update_queue.join()
+    elapsed = time.perf_counter() - started
+
+    await app.stop()
+    await app.shutdown()
+    await async_db.stop()
+
+    durations.sort()
+    count = len(durations)
+    p99 = durations[max(0, int(count * 0.99) - 1)]
+    print(f"replayed {count} updates in {elapsed:.2f}s at speed {args.speed or 'max'}: "
+          f"{count / elapsed:.1f} updates/s, {len(entries) - count} shed")
+    print(f"  handling  p50 {statistics.median(durations) * 1000:8.2f} ms  "
+          f"p99 {p99 * 1000:8.2f} ms  max {durations[-1] * 1000:8.2f} ms")
+    print(f"  max slip behind schedule {max(slips) * 1000:.1f} ms")
+    print(f"  DB ops/update {(DB_QUERY_SECONDS.total_count() - db_before) / count:.2f}, "
+          f"API calls/update {request.total_calls / count:.2f}")
+    print("  API calls " + ", ".join(f"{m}={c}" for m, c in request.calls.most_common()))
+
+def main(args):
+    from utils.update_recorder import read_update_log
+
+    entries = list(read_update_log(args.log))
+    if args.limit:
+        entries = entries[:args.limit]
+    if not entries:
+        raise SystemExit(f"No updates in {args.log}")
+    print(traffic_shape(entries))
+    os.chdir(tempfile.mkdtemp(prefix="ironcore-replay-"))
+    asyncio.run(replay(args, entries))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("log", help="JSONL (.gz) update log")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="Time compression factor (1 = real time, 0 = as fast as possible)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated API latency (s)")
+    parser.add_argument("--limit", type=int, default=0, help="Replay only the first N updates")
+    parser.add_argument("--no-admins-from-log", dest="admins_from_log", action="store_false",
+                        help="Don't treat command senders as chat admins")
+    args = parser.parse_args()
+    args.log = str(Path(args.log).resolve())
+    main(args)
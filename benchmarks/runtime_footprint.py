@@ -0,0 +1,120 @@
+"""Compare startup time and memory of the two web server layouts.
+
+"process" mirrors the multiprocessing layout in IRonCore's __main__ block
+(uvicorn in a child process, WEB_WORKERS workers); "embedded" serves the
+same FastAPI app from the bot's own event loop. Startup time is measured
+until the health check answers; RSS is summed over the whole process tree.
+Run from the repository root:
+
+    python -m benchmarks.runtime_footprint --workers 1
+"""
+import os
+import sys
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import urllib.request
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def tree_rss_kb(root_pid: int) -> tuple:
+    """Sum VmRSS over a process and all its descendants (Linux /proc)"""
+    parents = {}
+    for entry in Path("/proc").iterdir():
+        if entry.name.isdigit():
+            try:
+                stat = (entry / "stat").read_text()
+                parents[int(entry.name)] = int(stat.rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+    tree, frontier = {root_pid}, [root_pid]
+    while frontier:
+        pid = frontier.pop()
+        children = [child for child, parent in parents.items() if parent == pid]
+        tree.update(children)
+        frontier.extend(children)
+    total = 0
+    for pid in tree:
+        try:
+            for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+                if line.startswith("VmRSS:"):
+                    total += int(line.split()[1])
+        except OSError:
+            continue
+    return total, len(tree)
+
+def run_child(mode: str):
+    """Start the bot's web layer the way IRonCore would, then idle"""
+    sys.path.insert(0, str(ROOT))
+    os.chdir(tempfile.mkdtemp(prefix="ironcore-bench-"))
+    import IRonCore  # Loads handlers, database and dotenv like the real bot
+    from handlers.web_server import run_web_server, create_embedded_server
+
+    if mode == "process":
+        import multiprocessing
+        web_process = multiprocessing.Process(target=run_web_server, daemon=True)
+        web_process.start()
+
+        async def idle():
+            await asyncio.sleep(3600)
+    else:
+        async def idle():
+            await create_embedded_server().serve()
+    asyncio.run(idle())
+
+def measure(mode: str, workers: int) -> dict:
+    port = free_port()
+    env = dict(os.environ, HOST="127.0.0.1", PORT=str(port),
+               WEB_WORKERS=str(workers), DEBUG_MODE="false")
+    started = time.perf_counter()
+    child = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.runtime_footprint", "--child", mode],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while True:
+            try:
+                urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1)
+                break
+            except OSError:
+                if child.poll() is not None or time.perf_counter() - started > 60:
+                    raise RuntimeError(f"{mode} server failed to start")
+                time.sleep(0.01)
+        ready = time.perf_counter() - started
+        time.sleep(1)  # Let workers finish booting
+        rss_kb, processes = tree_rss_kb(child.pid)
+    finally:
+        subprocess.run(["pkill", "-TERM", "-P", str(child.pid)], check=False)
+        child.terminate()
+        child.wait()
+    return {"mode": mode, "ready_s": ready, "rss_mb": rss_kb / 1024, "processes": processes}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=1, help="WEB_WORKERS for process mode")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--child", choices=["process", "embedded"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child)
+    else:
+        for mode in ("process", "embedded"):
+            try:
+                results = [measure(mode, args.workers) for _ in range(args.runs)]
+            except RuntimeError as e:
+                print(f"{mode:<9} {e}")
+                continue
+            print(
+                f"{mode:<9} ready {min(r['ready_s'] for r in results):6.2f} s (best of {args.runs})  "
+                f"RSS {results[-1]['rss_mb']:7.1f} MB  processes {results[-1]['processes']}"
+            )
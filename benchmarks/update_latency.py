@@ -0,0 +1,184 @@
+"""Compare end-to-end update latency of polling and webhook ingestion.
+
+A minimal fake Bot API (getMe/getUpdates/setWebhook/deleteWebhook) runs on
+localhost and adds a simulated network round trip (--rtt) to every call and
+webhook delivery. Each update's latency is the time from its creation to the
+moment a handler sees it. Run from the repository root:
+
+    python -m benchmarks.update_latency --updates 500 --interval 0.005 --rtt 0.05
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import statistics
+from pathlib import Path
+from urllib.parse import parse_qsl
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("WEBHOOK_SECRET", "bench-secret")
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+from starlette.requests import ClientDisconnect
+from telegram import Update
+from telegram.ext import ApplicationBuilder, TypeHandler
+
+TOKEN = "123456:benchmark"
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def make_update(update_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": -1000 - update_id % 20, "type": "supergroup", "title": "Bench"},
+            "from": {"id": 1000 + update_id, "is_bot": False, "first_name": "User"},
+            "text": "hello"
+        }
+    }
+
+class FakeBotApi:
+    """Just enough of the Bot API to run an Application against"""
+
+    def __init__(self, rtt: float):
+        self.rtt = rtt
+        self.pending = []
+        self.arrived = asyncio.Event()
+        self.app = FastAPI()
+        self.app.post("/bot{token}/{method}")(self.handle)
+
+    def push(self, update: dict):
+        self.pending.append(update)
+        self.arrived.set()
+
+    async def handle(self, token: str, method: str, request: Request):
+        try:
+            params = dict(parse_qsl((await request.body()).decode()))
+        except ClientDisconnect:  # Long poll abandoned on shutdown
+            return {"ok": False}
+        await asyncio.sleep(self.rtt / 2)  # Request travelling to Telegram
+        try:
+            return await self.respond(method, params)
+        finally:
+            await asyncio.sleep(self.rtt / 2)  # Response travelling back
+
+    async def respond(self, method: str, params: dict):
+        if method == "getMe":
+            return {"ok": True, "result": BOT_USER}
+        if method == "getUpdates":
+            offset = int(params.get("offset", 0))
+            self.pending = [u for u in self.pending if u["update_id"] >= offset]
+            if not self.pending:
+                self.arrived.clear()
+                try:
+                    await asyncio.wait_for(self.arrived.wait(), float(params.get("timeout", 0)))
+                except asyncio.TimeoutError:
+                    pass
+            return {"ok": True, "result": self.pending[:100]}
+        return {"ok": True, "result": True}
+
+async def serve(app, port: int):
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    server.install_signal_handlers = lambda: None
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    return server, task
+
+async def run_mode(mode: str, args) -> list:
+    api = FakeBotApi(args.rtt)
+    api_port = free_port()
+    api_server, api_task = await serve(api.app, api_port)
+
+    sent_at = {}
+    latencies = []
+    done = asyncio.Event()
+
+    async def record(update: Update, context):
+        latencies.append(time.perf_counter() - sent_at[update.update_id])
+        if len(latencies) == args.updates:
+            done.set()
+
+    app = (
+        ApplicationBuilder()
+        .token(TOKEN)
+        .base_url(f"http://127.0.0.1:{api_port}/bot")
+        .concurrent_updates(True)
+        .build()
+    )
+    app.add_handler(TypeHandler(Update, record))
+    await app.initialize()
+    await app.start()
+
+    client = httpx.AsyncClient()
+    if mode == "webhook":
+        from handlers import web_server
+        web_server.attach_application(app)
+        hook_port = free_port()
+        hook_server, hook_task = await serve(web_server.web_app, hook_port)
+        hook_url = f"http://127.0.0.1:{hook_port}{web_server.WEBHOOK_PATH}"
+        headers = {"X-Telegram-Bot-Api-Secret-Token": web_server.WEBHOOK_SECRET}
+
+        async def deliver(update):
+            await asyncio.sleep(args.rtt / 2)  # Telegram -> our server
+            await client.post(hook_url, content=json.dumps(update), headers=headers)
+    else:
+        await app.updater.start_polling(timeout=30)
+
+        async def deliver(update):
+            api.push(update)
+
+    deliveries = []
+    for update_id in range(1, args.updates + 1):
+        update = make_update(update_id)
+        sent_at[update_id] = time.perf_counter()
+        deliveries.append(asyncio.create_task(deliver(update)))
+        await asyncio.sleep(args.interval)
+    await asyncio.gather(*deliveries)
+    await asyncio.wait_for(done.wait(), 30)
+
+    if mode == "webhook":
+        hook_server.should_exit = True
+        await hook_task
+    else:
+        await app.updater.stop()
+    await client.aclose()
+    await app.stop()
+    await app.shutdown()
+    api_server.should_exit = True
+    await api_task
+    return latencies
+
+def report(mode: str, latencies: list):
+    latencies = sorted(latencies)
+    p99 = latencies[max(0, int(len(latencies) * 0.99) - 1)]
+    print(
+        f"{mode:<8} n={len(latencies)}  "
+        f"p50 {statistics.median(latencies) * 1000:7.2f} ms  "
+        f"p99 {p99 * 1000:7.2f} ms  "
+        f"max {latencies[-1] * 1000:7.2f} ms"
+    )
+
+async def main(args):
+    for mode in ("polling", "webhook"):
+        report(mode, await run_mode(mode, args))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--updates", type=int, default=500)
+    parser.add_argument("--interval", type=float, default=0.005,
+                        help="Seconds between generated updates")
+    parser.add_argument("--rtt", type=float, default=0.05,
+                        help="Simulated round trip to the Bot API in seconds")
+    asyncio.run(main(parser.parse_args()))
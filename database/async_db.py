@@ -0,0 +1,291 @@
+"""Async database API: one writer thread fed by a queue, reads on a thread pool"""
+import os
+import time
+import queue
+import asyncio
+import logging
+import threading
+from datetime import datetime
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from database import database
+from utils.cache import LRUCache
+from utils.metrics import register_cache_metrics
+
+logger = logging.getLogger(__name__)
+
+READ_WORKERS = int(os.getenv("DB_READ_WORKERS", "4"))
+# Join dates are buffered and written in one transaction per interval or batch
+JOIN_FLUSH_INTERVAL = float(os.getenv("JOIN_FLUSH_MS", "200")) / 1000
+JOIN_FLUSH_ROWS = int(os.getenv("JOIN_FLUSH_ROWS", "500"))
+
+# Read-through cache of chat_settings rows: {chat_id: {column: value} or None}
+SETTINGS_CACHE = LRUCache(maxsize=int(os.getenv("SETTINGS_CACHE_SIZE", "10000")))
+# Active warnings of recent offenders: {(chat_id, user_id): [warning, ...]}
+WARNINGS_CACHE = LRUCache(maxsize=int(os.getenv("WARNINGS_CACHE_SIZE", "10000")))
+register_cache_metrics("settings", SETTINGS_CACHE)
+register_cache_metrics("warnings", WARNINGS_CACHE)
+
+_write_queue = queue.SimpleQueue()
+_writer_thread = None
+_read_executor = None
+_state_lock = threading.Lock()
+_STOP = object()
+_MISSING = object()
+
+# Write-behind join dates: {(chat_id, user_id): join_date isoformat}
+_pending_joins = {}
+_flushing_joins = {}  # Rows handed to the writer but not yet committed
+_join_flush_timer = None
+_join_flush_tasks = set()
+
+def _resolve(future: asyncio.Future, result=None, error: BaseException = None):
+    """Complete a future from the event loop thread (ignores cancelled waiters)"""
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+def _writer_loop():
+    """Execute queued writes one by one on this thread's connection"""
+    while True:
+        item = _write_queue.get()
+        if item is _STOP:
+            break
+        func, args, future, loop = item
+        try:
+            result = func(*args)
+        except Exception as e:
+            loop.call_soon_threadsafe(_resolve, future, None, e)
+        else:
+            loop.call_soon_threadsafe(_resolve, future, result)
+
+def start():
+    """Start the writer thread and read pool (idempotent)"""
+    global _writer_thread, _read_executor
+    with _state_lock:
+        if _writer_thread is None or not _writer_thread.is_alive():
+            _writer_thread = threading.Thread(
+                target=_writer_loop,
+                name="db-writer",
+                daemon=True
+            )
+            _writer_thread.start()
+        if _read_executor is None:
+            _read_executor = ThreadPoolExecutor(
+                max_workers=READ_WORKERS,
+                thread_name_prefix="db-read"
+            )
+
+async def stop():
+    """Drain pending writes and stop the worker threads"""
+    global _writer_thread, _read_executor
+    await flush_joins()
+    with _state_lock:
+        writer, executor = _writer_thread, _read_executor
+        _writer_thread, _read_executor = None, None
+    if writer is not None:
+        _write_queue.put(_STOP)
+        await asyncio.get_running_loop().run_in_executor(None, writer.join)
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+def pending_writes() -> int:
+    """Number of writes waiting for the writer thread"""
+    return _write_queue.qsize()
+
+async def _write(func, *args):
+    """Queue a write for the writer thread and wait for its result"""
+    start()
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    _write_queue.put((func, args, future, loop))
+    return await future
+
+async def _read(func, *args):
+    """Run a read on the read pool"""
+    start()
+    return await asyncio.get_running_loop().run_in_executor(
+        _read_executor, partial(func, *args)
+    )
+
+def _schedule_join_flush():
+    global _join_flush_timer
+    if _join_flush_timer is None:
+        _join_flush_timer = asyncio.get_running_loop().call_later(
+            JOIN_FLUSH_INTERVAL, _start_join_flush
+        )
+
+def _start_join_flush():
+    global _join_flush_timer
+    _join_flush_timer = None
+    task = asyncio.get_running_loop().create_task(flush_joins())
+    _join_flush_tasks.add(task)
+    task.add_done_callback(_join_flush_tasks.discard)
+
+async def flush_joins():
+    """Write buffered join dates in a single transaction"""
+    global _join_flush_timer, _pending_joins
+    if _join_flush_timer is not None:
+        _join_flush_timer.cancel()
+        _join_flush_timer = None
+    if not _pending_joins:
+        return
+    batch, _pending_joins = _pending_joins, {}
+    _flushing_joins.update(batch)
+    try:
+        await _write(database.store_join_rows, [(c, u, d) for (c, u), d in batch.items()])
+    except Exception as e:
+        logger.error(f"Join date flush failed, retrying {len(batch)} rows: {e}")
+        for key, joined in batch.items():
+            _pending_joins.setdefault(key, joined)
+        _schedule_join_flush()
+    finally:
+        for key, joined in batch.items():
+            if _flushing_joins.get(key) == joined:
+                del _flushing_joins[key]
+
+async def store_join_date(chat_id: int, user_id: int):
+    """Buffer a user's join date; written within JOIN_FLUSH_INTERVAL"""
+    _pending_joins[(chat_id, user_id)] = datetime.now().isoformat()
+    if len(_pending_joins) >= JOIN_FLUSH_ROWS:
+        await flush_joins()  # Back-pressure on large bursts
+    else:
+        _schedule_join_flush()
+
+async def get_join_date(chat_id: int, user_id: int) -> datetime:
+    """Get a user's join date, including ones not yet written"""
+    key = (chat_id, user_id)
+    joined = _pending_joins.get(key) or _flushing_joins.get(key)
+    if joined is not None:
+        return datetime.fromisoformat(joined)
+    return await _read(database.get_join_date, chat_id, user_id)
+
+async def get_recent_joins(chat_id: int, since: datetime, limit: int) -> list:
+    """User IDs that joined a chat at or after `since`, newest first"""
+    stored = await _read(database.get_recent_joins, chat_id, since, limit)
+    cutoff = since.isoformat()
+    buffered = sorted(
+        ((joined, user_id) for (c, user_id), joined in {**_flushing_joins, **_pending_joins}.items()
+         if c == chat_id and joined >= cutoff),
+        reverse=True
+    )
+    user_ids = [user_id for _, user_id in buffered]
+    seen = set(user_ids)
+    user_ids.extend(user_id for user_id in stored if user_id not in seen)
+    return user_ids[:limit]
+
+async def get_chat_settings(chat_id: int) -> dict:
+    """A chat's whole settings row, loaded once on a cache miss (None if unset)"""
+    row = SETTINGS_CACHE.get(chat_id, _MISSING)
+    if row is _MISSING:
+        row = await _read(database.get_chat_settings, chat_id)
+        SETTINGS_CACHE.set(chat_id, row)  # Also caches "not set" (None)
+    return row
+
+async def update_chat_settings(chat_id: int, **values):
+    """Set some of a chat's settings and cache the updated row"""
+    SETTINGS_CACHE.set(chat_id, await _write(database.update_chat_settings, chat_id, values))
+
+async def _chat_setting(chat_id: int, column: str):
+    row = await get_chat_settings(chat_id)
+    return row[column] if row else None
+
+async def set_welcome_message(chat_id: int, message: str):
+    """Set welcome message for a chat"""
+    await update_chat_settings(chat_id, welcome_message=message)
+
+async def get_welcome_message(chat_id: int) -> str:
+    """Get welcome message for a chat"""
+    return await _chat_setting(chat_id, "welcome_message")
+
+async def set_goodbye_message(chat_id: int, message: str):
+    """Set goodbye message for a chat"""
+    await update_chat_settings(chat_id, goodbye_message=message)
+
+async def get_goodbye_message(chat_id: int) -> str:
+    """Get goodbye message for a chat"""
+    return await _chat_setting(chat_id, "goodbye_message")
+
+async def set_warn_limit(chat_id: int, limit: int):
+    """Set how many active warnings trigger an automatic ban"""
+    await update_chat_settings(chat_id, warn_limit=limit)
+
+async def get_warn_limit(chat_id: int) -> int:
+    """Get a chat's warn limit, or None for the default"""
+    return await _chat_setting(chat_id, "warn_limit")
+
+async def set_flood_settings(chat_id: int, limit: int, window: float):
+    """Set a chat's flood threshold: `limit` messages per `window` seconds"""
+    await update_chat_settings(chat_id, flood_limit=limit, flood_window=window)
+
+async def get_flood_settings(chat_id: int) -> tuple:
+    """Get a chat's (limit, window), or None for the defaults"""
+    row = await get_chat_settings(chat_id)
+    if not row or row["flood_limit"] is None:
+        return None
+    return row["flood_limit"], row["flood_window"]
+
+async def store_username(chat_id: int, user_id: int, username: str):
+    """Record a user's current username in a chat"""
+    await _write(database.store_username, chat_id, user_id, username)
+
+async def get_user_id_by_username(chat_id: int, username: str) -> int:
+    """Look up a user ID by username within a chat"""
+    return await _read(database.get_user_id_by_username, chat_id, username)
+
+async def get_warnings(chat_id: int, user_id: int, since: float) -> list:
+    """Get a user's warnings issued after `since`, oldest first"""
+    warnings = WARNINGS_CACHE.get((chat_id, user_id))
+    if warnings is None:
+        # `since` only moves forward, so later calls just filter this list
+        warnings = await _read(database.get_warnings, chat_id, user_id, since)
+        WARNINGS_CACHE.set((chat_id, user_id), warnings)
+    return [w for w in warnings if w['time'] >= since]
+
+async def add_warning(chat_id: int, user_id: int, reason: str, admin_id: int, since: float) -> list:
+    """Record a warning and return the user's active warnings"""
+    warnings = await get_warnings(chat_id, user_id, since)
+    warning = {'time': time.time(), 'reason': reason, 'by': admin_id}
+    await _write(database.add_warning, chat_id, user_id, reason, admin_id, warning['time'])
+    warnings = warnings + [warning]
+    WARNINGS_CACHE.set((chat_id, user_id), warnings)
+    return warnings
+
+async def clear_warnings(chat_id: int, user_id: int):
+    """Delete all of a user's warnings in a chat"""
+    await _write(database.clear_warnings, chat_id, user_id)
+    WARNINGS_CACHE.set((chat_id, user_id), [])
+
+async def prune_warnings(before: float) -> int:
+    """Delete warnings older than `before` from storage"""
+    return await _write(database.prune_warnings, before)
+
+async def expire_warnings(chat_id: int, user_id: int, before: float):
+    """Delete a user's warnings older than `before`"""
+    await _write(database.expire_warnings, chat_id, user_id, before)
+    warnings = WARNINGS_CACHE.get((chat_id, user_id))
+    if warnings is not None:
+        WARNINGS_CACHE.set((chat_id, user_id), [w for w in warnings if w['time'] >= before])
+
+async def add_scheduled_job(kind: str, chat_id: int, run_at: float, payload: str) -> int:
+    """Persist a timer job; returns its ID"""
+    return await _write(database.add_scheduled_job, kind, chat_id, run_at, payload)
+
+async def get_scheduled_jobs(start: float, end: float, shard: int = 0, shard_count: int = 1) -> list:
+    """Jobs with start <= run_at < end for one shard, soonest first"""
+    return await _read(database.get_scheduled_jobs, start, end, shard, shard_count)
+
+async def reschedule_scheduled_job(job_id: int, run_at: float, attempts: int) -> bool:
+    """Move a failed job to its retry time; False if it was cancelled meanwhile"""
+    return await _write(database.reschedule_scheduled_job, job_id, run_at, attempts)
+
+async def delete_scheduled_jobs(job_ids: list):
+    """Remove finished or cancelled jobs"""
+    await _write(database.delete_scheduled_jobs, list(job_ids))
+
+async def delete_scheduled_jobs_of_kind(kind: str, chat_id: int, payload: str) -> list:
+    """Remove matching jobs; returns the IDs removed"""
+    return await _write(database.delete_scheduled_jobs_of_kind, kind, chat_id, payload)
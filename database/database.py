@@ -1,104 +1,468 @@
 import sqlite3
+import logging
+import functools
+import threading
 from datetime import datetime
 from pathlib import Path
+from utils.metrics import Histogram
+
+logger = logging.getLogger(__name__)
 
 DB_PATH = Path("bot_data.db")
 
+# Connection tuning
+CACHE_SIZE_KB = 8192         # Page cache per connection (negative PRAGMA value = KiB)
+STATEMENT_CACHE_SIZE = 128   # Prepared statements kept per connection
+BUSY_TIMEOUT = 30            # Seconds to wait on a locked database
+
+DB_QUERY_SECONDS = Histogram(
+    "ironcore_db_query_seconds", "SQLite call latency by storage function", ("query",)
+)
+
+# Long-lived connections, one per thread, opened on first use
+_local = threading.local()
+_connections = []
+_connections_lock = threading.Lock()
+_generation = 0
+# SQLite allows a single writer at a time; serialize writes in-process
+_write_lock = threading.Lock()
+_schema_ready = False
+
+def _connect() -> sqlite3.Connection:
+    """Open a connection tuned for a long-running bot"""
+    conn = sqlite3.connect(
+        DB_PATH,
+        timeout=BUSY_TIMEOUT,
+        check_same_thread=False,
+        cached_statements=STATEMENT_CACHE_SIZE
+    )
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KB}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+def get_connection() -> sqlite3.Connection:
+    """Get this thread's persistent connection, opening it if needed"""
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "generation", None) != _generation:
+        conn = _connect()
+        with _connections_lock:
+            _connections.append(conn)
+        _local.conn = conn
+        _local.generation = _generation
+    return conn
+
+def close_db():
+    """Close all persistent connections (call once on shutdown)"""
+    global _generation
+    with _connections_lock:
+        for conn in _connections:
+            try:
+                conn.execute("PRAGMA optimize")
+                conn.close()
+            except sqlite3.Error:
+                pass
+        _connections.clear()
+        _generation += 1
+
+def _timed(func):
+    """Record a storage function's latency in DB_QUERY_SECONDS"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with DB_QUERY_SECONDS.time(func.__name__):
+            return func(*args, **kwargs)
+    return wrapper
+
+def _write(sql: str, params: tuple = ()):
+    """Run a single write statement in its own transaction"""
+    conn = get_connection()
+    with _write_lock, conn:
+        conn.execute(sql, params)
+
+def _fetchone(sql: str, params: tuple = ()):
+    """Run a read query and return the first row"""
+    return get_connection().execute(sql, params).fetchone()
+
+def _migrate_base_schema(cursor):
+    """Tables as they were before versioned migrations (no-op on those databases)"""
+    # User join dates table
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS user_join_dates (
+        chat_id INTEGER,
+        user_id INTEGER,
+        join_date TEXT,
+        PRIMARY KEY (chat_id, user_id)
+    )
+    """)
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_join_dates_recent
+    ON user_join_dates (chat_id, join_date)
+    """)
+
+    # Welcome messages table
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS welcome_messages (
+        chat_id INTEGER PRIMARY KEY,
+        message TEXT
+    )
+    """)
+
+    # Goodbye messages table
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS goodbye_messages (
+        chat_id INTEGER PRIMARY KEY,
+        message TEXT
+    )
+    """)
+
+    # Username index: (chat_id, lowercased username) -> user_id
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS chat_usernames (
+        chat_id INTEGER,
+        username TEXT,
+        user_id INTEGER,
+        updated_at TEXT,
+        PRIMARY KEY (chat_id, username)
+    )
+    """)
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_chat_usernames_user
+    ON chat_usernames (chat_id, user_id)
+    """)
+
+    # Warnings table
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS warnings (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        chat_id INTEGER,
+        user_id INTEGER,
+        reason TEXT,
+        admin_id INTEGER,
+        created_at REAL
+    )
+    """)
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_warnings_target
+    ON warnings (chat_id, user_id, created_at)
+    """)
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_warnings_created
+    ON warnings (created_at)
+    """)
+
+    # Per-chat anti-flood thresholds (flood_limit 0 = disabled)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS flood_settings (
+        chat_id INTEGER PRIMARY KEY,
+        flood_limit INTEGER,
+        flood_window REAL
+    )
+    """)
+
+    # Timer jobs run by utils/timers.py
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS scheduled_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        chat_id INTEGER,
+        run_at REAL NOT NULL,
+        payload TEXT
+    )
+    """)
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_scheduled_jobs_run_at
+    ON scheduled_jobs (run_at)
+    """)
+
+def _migrate_chat_settings(cursor):
+    """Fold the per-setting tables into one chat_settings row per chat"""
+    cursor.execute("""
+    CREATE TABLE chat_settings (
+        chat_id INTEGER PRIMARY KEY,
+        welcome_message TEXT,
+        goodbye_message TEXT,
+        warn_limit INTEGER,
+        flood_limit INTEGER,
+        flood_window REAL
+    )
+    """)
+    cursor.execute("""
+    INSERT INTO chat_settings (chat_id, welcome_message, goodbye_message, flood_limit, flood_window)
+    SELECT ids.chat_id, w.message, g.message, f.flood_limit, f.flood_window
+    FROM (
+        SELECT chat_id FROM welcome_messages
+        UNION SELECT chat_id FROM goodbye_messages
+        UNION SELECT chat_id FROM flood_settings
+    ) AS ids
+    LEFT JOIN welcome_messages w ON w.chat_id = ids.chat_id
+    LEFT JOIN goodbye_messages g ON g.chat_id = ids.chat_id
+    LEFT JOIN flood_settings f ON f.chat_id = ids.chat_id
+    """)
+    cursor.execute("DROP TABLE welcome_messages")
+    cursor.execute("DROP TABLE goodbye_messages")
+    cursor.execute("DROP TABLE flood_settings")
+
+def _migrate_job_attempts(cursor):
+    """Count failed runs so timer jobs are retried with backoff"""
+    cursor.execute("""
+    ALTER TABLE scheduled_jobs ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0
+    """)
+
+# Applied in order; PRAGMA user_version records how many have run. Append only.
+MIGRATIONS = [
+    _migrate_base_schema,
+    _migrate_chat_settings,
+    _migrate_job_attempts,
+]
+
 def init_db():
-    """Initialize the database with all required tables"""
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        
-        # User join dates table
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS user_join_dates (
-            chat_id INTEGER,
-            user_id INTEGER,
-            join_date TEXT,
-            PRIMARY KEY (chat_id, user_id)
-        )
-        """)
-        
-        # Welcome messages table
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS welcome_messages (
-            chat_id INTEGER PRIMARY KEY,
-            message TEXT
-        )
-        """)
-        
-        # Goodbye messages table
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS goodbye_messages (
-            chat_id INTEGER PRIMARY KEY,
-            message TEXT
-        )
-        """)
-        
-        conn.commit()
+    """Bring the schema up to the latest version (runs once per process)"""
+    global _schema_ready
+    if _schema_ready:
+        return
+    conn = get_connection()
+    with _write_lock:
+        # IMMEDIATE takes the write lock first, so concurrent shards migrate once
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version > len(MIGRATIONS):
+                raise RuntimeError(f"{DB_PATH} has schema version {version}, newer than this code")
+            cursor = conn.cursor()
+            for number, migration in enumerate(MIGRATIONS[version:], version + 1):
+                logger.info(f"Migrating {DB_PATH} to schema version {number} ({migration.__name__})")
+                migration(cursor)
+            conn.execute(f"PRAGMA user_version = {len(MIGRATIONS)}")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    _schema_ready = True
 
+@_timed
 def store_join_date(chat_id: int, user_id: int):
     """Store or update a user's join date"""
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
+    _write("""
+    INSERT OR REPLACE INTO user_join_dates (chat_id, user_id, join_date)
+    VALUES (?, ?, ?)
+    """, (chat_id, user_id, datetime.now().isoformat()))
+
+@_timed
+def store_join_rows(rows: list):
+    """Upsert many (chat_id, user_id, join_date) rows in one transaction"""
+    conn = get_connection()
+    with _write_lock, conn:
+        conn.executemany("""
         INSERT OR REPLACE INTO user_join_dates (chat_id, user_id, join_date)
         VALUES (?, ?, ?)
-        """, (chat_id, user_id, datetime.now().isoformat()))
-        conn.commit()
+        """, rows)
 
+@_timed
 def get_join_date(chat_id: int, user_id: int) -> datetime:
     """Get a user's join date"""
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-        SELECT join_date FROM user_join_dates
-        WHERE chat_id = ? AND user_id = ?
-        """, (chat_id, user_id))
-        result = cursor.fetchone()
-        return datetime.fromisoformat(result[0]) if result else None
+    result = _fetchone("""
+    SELECT join_date FROM user_join_dates
+    WHERE chat_id = ? AND user_id = ?
+    """, (chat_id, user_id))
+    return datetime.fromisoformat(result[0]) if result else None
 
+@_timed
+def get_recent_joins(chat_id: int, since: datetime, limit: int) -> list:
+    """User IDs that joined a chat at or after `since`, newest first"""
+    rows = get_connection().execute("""
+    SELECT user_id FROM user_join_dates
+    WHERE chat_id = ? AND join_date >= ?
+    ORDER BY join_date DESC
+    LIMIT ?
+    """, (chat_id, since.isoformat(), limit)).fetchall()
+    return [row[0] for row in rows]
+
+CHAT_SETTINGS_COLUMNS = (
+    "welcome_message", "goodbye_message", "warn_limit", "flood_limit", "flood_window"
+)
+
+def _fetch_chat_settings(conn: sqlite3.Connection, chat_id: int) -> dict:
+    row = conn.execute(f"""
+    SELECT {", ".join(CHAT_SETTINGS_COLUMNS)} FROM chat_settings
+    WHERE chat_id = ?
+    """, (chat_id,)).fetchone()
+    return dict(zip(CHAT_SETTINGS_COLUMNS, row)) if row else None
+
+@_timed
+def get_chat_settings(chat_id: int) -> dict:
+    """Get a chat's settings row as {column: value}, or None if nothing is set"""
+    return _fetch_chat_settings(get_connection(), chat_id)
+
+@_timed
+def update_chat_settings(chat_id: int, values: dict) -> dict:
+    """Set some of a chat's settings; returns the whole updated row"""
+    unknown = set(values) - set(CHAT_SETTINGS_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown chat settings: {', '.join(sorted(unknown))}")
+    columns = list(values)
+    conn = get_connection()
+    with _write_lock, conn:
+        conn.execute(f"""
+        INSERT INTO chat_settings (chat_id, {", ".join(columns)})
+        VALUES (?, {", ".join("?" for _ in columns)})
+        ON CONFLICT (chat_id) DO UPDATE SET
+        {", ".join(f"{column} = excluded.{column}" for column in columns)}
+        """, (chat_id, *values.values()))
+        return _fetch_chat_settings(conn, chat_id)
+
+# Pre-chat_settings accessors, kept for existing callers. Writes through them
+# bypass async_db's settings cache; the bot itself uses the async versions.
 def set_welcome_message(chat_id: int, message: str):
     """Set welcome message for a chat"""
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-        INSERT OR REPLACE INTO welcome_messages (chat_id, message)
-        VALUES (?, ?)
-        """, (chat_id, message))
-        conn.commit()
+    update_chat_settings(chat_id, {"welcome_message": message})
 
 def get_welcome_message(chat_id: int) -> str:
     """Get welcome message for a chat"""
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-        SELECT message FROM welcome_messages
-        WHERE chat_id = ?
-        """, (chat_id,))
-        result = cursor.fetchone()
-        return result[0] if result else None
+    settings = get_chat_settings(chat_id)
+    return settings["welcome_message"] if settings else None
 
 def set_goodbye_message(chat_id: int, message: str):
     """Set goodbye message for a chat"""
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-        INSERT OR REPLACE INTO goodbye_messages (chat_id, message)
-        VALUES (?, ?)
-        """, (chat_id, message))
-        conn.commit()
+    update_chat_settings(chat_id, {"goodbye_message": message})
 
 def get_goodbye_message(chat_id: int) -> str:
     """Get goodbye message for a chat"""
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-        SELECT message FROM goodbye_messages
-        WHERE chat_id = ?
-        """, (chat_id,))
-        result = cursor.fetchone()
-        return result[0] if result else None
-
-# Initialize database when module loads
-init_db()
+    settings = get_chat_settings(chat_id)
+    return settings["goodbye_message"] if settings else None
+
+def set_flood_settings(chat_id: int, limit: int, window: float):
+    """Set a chat's flood threshold: `limit` messages per `window` seconds"""
+    update_chat_settings(chat_id, {"flood_limit": limit, "flood_window": window})
+
+def get_flood_settings(chat_id: int) -> tuple:
+    """Get a chat's (limit, window), or None for the defaults"""
+    settings = get_chat_settings(chat_id)
+    if not settings or settings["flood_limit"] is None:
+        return None
+    return settings["flood_limit"], settings["flood_window"]
+
+@_timed
+def store_username(chat_id: int, user_id: int, username: str):
+    """Record a user's current username in a chat (None clears it)"""
+    conn = get_connection()
+    with _write_lock, conn:
+        # Drop the user's previous username, if it changed
+        conn.execute("""
+        DELETE FROM chat_usernames
+        WHERE chat_id = ? AND user_id = ?
+        """, (chat_id, user_id))
+        if username:
+            conn.execute("""
+            INSERT OR REPLACE INTO chat_usernames (chat_id, username, user_id, updated_at)
+            VALUES (?, ?, ?, ?)
+            """, (chat_id, username.lower(), user_id, datetime.now().isoformat()))
+
+@_timed
+def get_user_id_by_username(chat_id: int, username: str) -> int:
+    """Look up a user ID by username within a chat"""
+    result = _fetchone("""
+    SELECT user_id FROM chat_usernames
+    WHERE chat_id = ? AND username = ?
+    """, (chat_id, username.lower()))
+    return result[0] if result else None
+
+@_timed
+def add_warning(chat_id: int, user_id: int, reason: str, admin_id: int, created_at: float):
+    """Record a warning against a user in a chat"""
+    _write("""
+    INSERT INTO warnings (chat_id, user_id, reason, admin_id, created_at)
+    VALUES (?, ?, ?, ?, ?)
+    """, (chat_id, user_id, reason, admin_id, created_at))
+
+@_timed
+def get_warnings(chat_id: int, user_id: int, since: float) -> list:
+    """Get a user's warnings issued after `since`, oldest first"""
+    rows = get_connection().execute("""
+    SELECT created_at, reason, admin_id FROM warnings
+    WHERE chat_id = ? AND user_id = ? AND created_at >= ?
+    ORDER BY created_at
+    """, (chat_id, user_id, since)).fetchall()
+    return [{'time': t, 'reason': reason, 'by': by} for t, reason, by in rows]
+
+@_timed
+def clear_warnings(chat_id: int, user_id: int):
+    """Delete all of a user's warnings in a chat"""
+    _write("""
+    DELETE FROM warnings
+    WHERE chat_id = ? AND user_id = ?
+    """, (chat_id, user_id))
+
+@_timed
+def prune_warnings(before: float) -> int:
+    """Delete warnings older than `before`; returns the number removed"""
+    conn = get_connection()
+    with _write_lock, conn:
+        return conn.execute("""
+        DELETE FROM warnings WHERE created_at < ?
+        """, (before,)).rowcount
+
+@_timed
+def expire_warnings(chat_id: int, user_id: int, before: float):
+    """Delete a user's warnings older than `before`"""
+    _write("""
+    DELETE FROM warnings
+    WHERE chat_id = ? AND user_id = ? AND created_at < ?
+    """, (chat_id, user_id, before))
+
+@_timed
+def add_scheduled_job(kind: str, chat_id: int, run_at: float, payload: str) -> int:
+    """Persist a timer job; returns its ID"""
+    conn = get_connection()
+    with _write_lock, conn:
+        return conn.execute("""
+        INSERT INTO scheduled_jobs (kind, chat_id, run_at, payload)
+        VALUES (?, ?, ?, ?)
+        """, (kind, chat_id, run_at, payload)).lastrowid
+
+@_timed
+def get_scheduled_jobs(start: float, end: float, shard: int = 0, shard_count: int = 1) -> list:
+    """Jobs with start <= run_at < end as (id, kind, chat_id, run_at, payload, attempts).
+
+    With several shards only jobs whose abs(chat_id) % shard_count == shard are returned.
+    """
+    return get_connection().execute("""
+    SELECT id, kind, chat_id, run_at, payload, attempts FROM scheduled_jobs
+    WHERE run_at >= ? AND run_at < ?
+    AND (? = 1 OR abs(chat_id) % ? = ?)
+    ORDER BY run_at
+    """, (start, end, shard_count, shard_count, shard)).fetchall()
+
+@_timed
+def reschedule_scheduled_job(job_id: int, run_at: float, attempts: int) -> bool:
+    """Move a failed job to its retry time; False if it was cancelled meanwhile"""
+    conn = get_connection()
+    with _write_lock, conn:
+        return conn.execute("""
+        UPDATE scheduled_jobs SET run_at = ?, attempts = ?
+        WHERE id = ?
+        """, (run_at, attempts, job_id)).rowcount > 0
+
+@_timed
+def delete_scheduled_jobs(job_ids: list):
+    """Remove finished or cancelled jobs"""
+    conn = get_connection()
+    with _write_lock, conn:
+        conn.executemany("""
+        DELETE FROM scheduled_jobs WHERE id = ?
+        """, [(job_id,) for job_id in job_ids])
+
+@_timed
+def delete_scheduled_jobs_of_kind(kind: str, chat_id: int, payload: str) -> list:
+    """Remove matching jobs; returns the IDs removed"""
+    conn = get_connection()
+    with _write_lock, conn:
+        job_ids = [row[0] for row in conn.execute("""
+        SELECT id FROM scheduled_jobs
+        WHERE kind = ? AND chat_id = ? AND payload = ?
+        """, (kind, chat_id, payload))]
+        conn.executemany("""
+        DELETE FROM scheduled_jobs WHERE id = ?
+        """, [(job_id,) for job_id in job_ids])
+    return job_ids
+
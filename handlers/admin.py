@@ -1,43 +1,127 @@
+import os
+import re
+import html
 import time
+import asyncio
+import logging
+from datetime import datetime, timedelta
 from telegram import Update, ChatPermissions
+from telegram.error import TelegramError
 from telegram.ext import ContextTypes, CommandHandler
-from handlers.group import is_group_admin, get_target_user
+from handlers.group import (
+    is_group_admin,
+    get_target_user,
+    target_args,
+    get_chat_admin_ids,
+    invalidate_member,
+    skip_welcome
+)
+from database import async_db as db
+from utils import timers
 
-# Warning storage (replace with database in production)
-WARNINGS_DB = {}
+logger = logging.getLogger(__name__)
+
+# Warnings are stored per (chat, user) and expire after WARN_EXPIRY_DAYS (0 = never)
+WARN_LIMIT = 3  # Default; chats can change theirs with /setwarnlimit
+WARN_LIMIT_MAX = 20
+WARN_EXPIRY = float(os.getenv("WARN_EXPIRY_DAYS", "30")) * 86400
+
+# Bulk moderation: targets per command and moderation calls in flight at once
+BULK_MAX_TARGETS = int(os.getenv("BULK_MAX_TARGETS", "200"))
+BULK_CONCURRENCY = int(os.getenv("BULK_CONCURRENCY", "5"))
+BULK_PROGRESS_INTERVAL = 3  # Seconds between progress message edits
+BULK_MAX_LISTED_FAILURES = 20
+
+# A whole argument like 30s, 2h or 1d12h; anything else is part of the reason
+DURATION_ARG = re.compile(r"^(\d+[smhd])+$")
+
+def warnings_since() -> float:
+    """Oldest warning timestamp that still counts"""
+    return time.time() - WARN_EXPIRY if WARN_EXPIRY else 0
+
+async def get_warn_limit(chat_id: int) -> int:
+    return await db.get_warn_limit(chat_id) or WARN_LIMIT
+
+async def prune_expired_warnings():
+    """Startup sweep for expired warnings that have no expiry job (older data)"""
+    if not WARN_EXPIRY:
+        return
+    try:
+        removed = await db.prune_warnings(warnings_since())
+        if removed:
+            logger.info(f"Pruned {removed} expired warnings")
+    except Exception as e:
+        logger.error(f"Warning prune failed: {e}")
+
+async def expire_warnings_job(bot, chat_id: int, payload: dict):
+    """Timer callback dropping a user's warnings once they expire"""
+    await db.expire_warnings(chat_id, payload["user_id"], warnings_since())
+
+async def unban_job(bot, chat_id: int, payload: dict):
+    """Timer callback lifting a temporary soft ban"""
+    await bot.restrict_chat_member(
+        chat_id=chat_id,
+        user_id=payload["user_id"],
+        permissions=ChatPermissions(
+            can_send_messages=True,
+            can_send_media_messages=True,
+            can_send_other_messages=True,
+            can_add_web_page_previews=True,
+            can_send_polls=True,
+            can_change_info=True,
+            can_invite_users=True,
+            can_pin_messages=True
+        )
+    )
+    invalidate_member(chat_id, payload["user_id"])
+
+async def soft_ban(bot, chat_id: int, user_id: int, duration: int = None):
+    """Restrict all permissions, replacing any pending unban (permanent without duration)"""
+    await bot.restrict_chat_member(
+        chat_id=chat_id,
+        user_id=user_id,
+        permissions=ChatPermissions(
+            can_send_messages=False,
+            can_send_media_messages=False,
+            can_send_other_messages=False,
+            can_add_web_page_previews=False,
+            can_send_polls=False,
+            can_change_info=False,
+            can_invite_users=False,
+            can_pin_messages=False
+        )
+    )
+    invalidate_member(chat_id, user_id)
+    skip_welcome(chat_id, user_id)
+    
+    # Clear warnings if any
+    await db.clear_warnings(chat_id, user_id)
+    
+    # A new ban replaces any pending unban
+    await timers.cancel("unban", chat_id, {"user_id": user_id})
+    if duration:
+        await timers.schedule_in("unban", chat_id, duration, {"user_id": user_id})
 
 async def ban_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Soft ban - restrict all permissions without kicking"""
+    """Soft ban - restrict all permissions without kicking (optionally for a duration)"""
     if not await is_group_admin(update, context):
         return
     
     if not (target := await get_target_user(update, context)):
         return
     
-    reason = " ".join(context.args[1:]) if len(context.args) > 1 else "No reason provided"
+    # "/ban @user|<user ID> [duration] [reason]" or a reply with "/ban [duration] [reason]"
+    rest = target_args(update, context)
+    duration = parse_duration_arg(rest[0]) if rest else None
+    if duration:
+        rest.pop(0)
+    reason = " ".join(rest) if rest else "No reason provided"
     
     try:
-        await context.bot.restrict_chat_member(
-            chat_id=update.effective_chat.id,
-            user_id=target.id,
-            permissions=ChatPermissions(
-                can_send_messages=False,
-                can_send_media_messages=False,
-                can_send_other_messages=False,
-                can_add_web_page_previews=False,
-                can_send_polls=False,
-                can_change_info=False,
-                can_invite_users=False,
-                can_pin_messages=False
-            )
-        )
-        
-        # Clear warnings if any
-        if target.id in WARNINGS_DB:
-            del WARNINGS_DB[target.id]
-        
+        await soft_ban(context.bot, update.effective_chat.id, target.id, duration)
         await update.message.reply_text(
             f"🚫 <b>Banned:</b> {target.mention_html()} (ID: <code>{target.id}</code>)\n"
+            f"⏱ <b>Duration:</b> {format_duration(duration)}\n"
             f"📝 <b>Reason:</b> {reason}\n\n"
             f"User remains in group but cannot perform any actions.",
             parse_mode="HTML"
@@ -61,6 +145,8 @@ async def hard_ban(update: Update, context: ContextTypes.DEFAULT_TYPE):
             chat_id=update.effective_chat.id,
             user_id=target.id
         )
+        invalidate_member(update.effective_chat.id, target.id)
+        skip_welcome(update.effective_chat.id, target.id)
         await update.message.reply_text(
             f"🚫 <b>Hard Banned:</b> {target.mention_html()} (ID: <code>{target.id}</code>)",
             parse_mode="HTML"
@@ -91,6 +177,8 @@ async def unban_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 can_pin_messages=True
             )
         )
+        invalidate_member(update.effective_chat.id, target.id)
+        await timers.cancel("unban", update.effective_chat.id, {"user_id": target.id})
         await update.message.reply_text(
             f"✅ <b>Unbanned:</b> {target.mention_html()} (ID: <code>{target.id}</code>)",
             parse_mode="HTML"
@@ -102,42 +190,44 @@ async def unban_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 
 async def warn_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Warn a user (3 warnings = auto ban)"""
+    """Warn a user (the chat's warn limit of warnings = auto ban)"""
     if not await is_group_admin(update, context):
         return
     
     if not (target := await get_target_user(update, context)):
         return
     
-    reason = " ".join(context.args[1:]) if len(context.args) > 1 else "No reason provided"
-    
-    # Initialize warnings if new user
-    if target.id not in WARNINGS_DB:
-        WARNINGS_DB[target.id] = []
+    reason = " ".join(target_args(update, context)) or "No reason provided"
     
     # Add warning
-    WARNINGS_DB[target.id].append({
-        'time': time.time(),
-        'reason': reason,
-        'by': update.effective_user.id
-    })
+    warnings = await db.add_warning(
+        update.effective_chat.id,
+        target.id,
+        reason,
+        update.effective_user.id,
+        warnings_since()
+    )
     
-    warning_count = len(WARNINGS_DB[target.id])
+    warning_count = len(warnings)
+    warn_limit = await get_warn_limit(update.effective_chat.id)
+    if WARN_EXPIRY:
+        await timers.schedule_in(
+            "expire_warnings", update.effective_chat.id, WARN_EXPIRY, {"user_id": target.id}
+        )
     
-    # Auto-ban at 3 warnings
-    if warning_count >= 3:
+    # Auto-ban at the warn limit: always permanent (soft_ban clears the warnings)
+    if warning_count >= warn_limit:
         try:
-            await ban_user(update, context)
+            await soft_ban(context.bot, update.effective_chat.id, target.id)
             warning_history = "\n".join(
                 f"{i+1}. {w['reason']} (by admin {w['by']})" 
-                for i, w in enumerate(WARNINGS_DB[target.id])
+                for i, w in enumerate(warnings)
             )
             await update.message.reply_text(
-                f"⚠️ <b>Auto-Banned:</b> {target.mention_html()} after 3 warnings\n\n"
+                f"⚠️ <b>Auto-Banned:</b> {target.mention_html()} after {warn_limit} warnings\n\n"
                 f"📜 <b>Warning History:</b>\n{warning_history}",
                 parse_mode="HTML"
             )
-            del WARNINGS_DB[target.id]
             return
         except Exception as e:
             await update.message.reply_text(
@@ -149,7 +239,7 @@ async def warn_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(
         f"⚠️ <b>Warning issued to {target.mention_html()}</b>\n"
         f"📝 <b>Reason:</b> {reason}\n"
-        f"🔢 <b>Warnings:</b> {warning_count}/3",
+        f"🔢 <b>Warnings:</b> {warning_count}/{warn_limit}",
         parse_mode="HTML"
     )
 
@@ -158,22 +248,42 @@ async def check_warnings(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not (target := await get_target_user(update, context)):
         return
     
-    if target.id not in WARNINGS_DB or not WARNINGS_DB[target.id]:
+    warnings = await db.get_warnings(update.effective_chat.id, target.id, warnings_since())
+    if not warnings:
         await update.message.reply_text("ℹ️ This user has no warnings")
         return
     
+    warn_limit = await get_warn_limit(update.effective_chat.id)
     warning_history = "\n".join(
         f"{i+1}. {w['reason']} (by admin {w['by']})" 
-        for i, w in enumerate(WARNINGS_DB[target.id])
+        for i, w in enumerate(warnings)
     )
     
     await update.message.reply_text(
         f"⚠️ <b>Warnings for {target.mention_html()}</b>\n\n"
-        f"🔢 <b>Total:</b> {len(WARNINGS_DB[target.id])}/3\n"
+        f"🔢 <b>Total:</b> {len(warnings)}/{warn_limit}\n"
         f"📜 <b>History:</b>\n{warning_history}",
         parse_mode="HTML"
     )
 
+async def set_warn_limit(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/setwarnlimit <warnings>"""
+    if not await is_group_admin(update, context):
+        await update.message.reply_text("❌ You need to be admin to use this command")
+        return
+
+    try:
+        limit = int(context.args[0])
+        if not 1 <= limit <= WARN_LIMIT_MAX:
+            raise ValueError
+    except (IndexError, ValueError):
+        await update.message.reply_text(
+            f"ℹ️ Usage: /setwarnlimit <warnings> (1-{WARN_LIMIT_MAX}). Default: {WARN_LIMIT}"
+        )
+        return
+    await db.set_warn_limit(update.effective_chat.id, limit)
+    await update.message.reply_text(f"✅ Users are now banned after {limit} warnings")
+
 # Your original functions remain unchanged
 async def kick_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Kick a user from the group"""
@@ -190,6 +300,8 @@ async def kick_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
             user_id=target.id,
             until_date=int(time.time()) + 60  # 60-second ban = kick
         )
+        invalidate_member(update.effective_chat.id, target.id)
+        skip_welcome(update.effective_chat.id, target.id)
         await update.message.reply_text(
             f"👢 <b>Kicked:</b> {target.mention_html()} (ID: <code>{target.id}</code>)",
             parse_mode="HTML"
@@ -266,6 +378,7 @@ async def mute_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
             ),
             until_date=until_date
         )
+        invalidate_member(update.effective_chat.id, target.id)
         
         await update.message.reply_text(
             f"🔇 <b>Muted:</b> {target.mention_html()} (ID: <code>{target.id}</code>)\n"
@@ -283,6 +396,11 @@ async def mute_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
             parse_mode="HTML"
         )
         
+def parse_duration_arg(arg: str) -> int:
+    """Seconds for an argument that is entirely a duration (e.g. 1d12h), else None"""
+    arg = arg.lower()
+    return parse_duration(arg) if DURATION_ARG.match(arg) else None
+
 def parse_duration(time_str: str) -> int:
     """Parse time duration string into seconds"""
     if not time_str:
@@ -371,6 +489,7 @@ async def unmute_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 can_add_web_page_previews=True
             )
         )
+        invalidate_member(update.effective_chat.id, target.id)
         await update.message.reply_text(
             f"🔊 <b>Unmuted:</b> {target.mention_html()} (ID: <code>{target.id}</code>)",
             parse_mode="HTML"
@@ -386,6 +505,201 @@ async def unmute_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 
 
+async def _bulk_soft_ban(bot, chat_id: int, user_id: int, until_date):
+    await soft_ban(bot, chat_id, user_id, until_date - int(time.time()) if until_date else None)
+
+async def _bulk_hard_ban(bot, chat_id: int, user_id: int, until_date):
+    await bot.ban_chat_member(chat_id=chat_id, user_id=user_id)
+    invalidate_member(chat_id, user_id)
+    skip_welcome(chat_id, user_id)
+
+async def _bulk_kick(bot, chat_id: int, user_id: int, until_date):
+    await bot.ban_chat_member(chat_id=chat_id, user_id=user_id, until_date=int(time.time()) + 60)
+    invalidate_member(chat_id, user_id)
+    skip_welcome(chat_id, user_id)
+
+async def _bulk_mute(bot, chat_id: int, user_id: int, until_date):
+    await bot.restrict_chat_member(
+        chat_id=chat_id,
+        user_id=user_id,
+        permissions=ChatPermissions(
+            can_send_messages=False,
+            can_send_media_messages=False,
+            can_send_other_messages=False,
+            can_add_web_page_previews=False
+        ),
+        until_date=until_date
+    )
+    invalidate_member(chat_id, user_id)
+
+# Format: {command: (action, emoji, past tense)}
+BULK_ACTIONS = {
+    "bulkban": (_bulk_soft_ban, "🚫", "Banned"),
+    "bulkhardban": (_bulk_hard_ban, "🚫", "Hard banned"),
+    "bulkkick": (_bulk_kick, "👢", "Kicked"),
+    "bulkmute": (_bulk_mute, "🔇", "Muted"),
+}
+BULK_TIMED = {"bulkban", "bulkmute"}  # Commands that accept a duration
+
+async def resolve_bulk_targets(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Parse @usernames, user IDs, `recent <duration>` and a ban/mute duration.
+
+    Returns ({label: user_id}, {label: failure}, seconds or None, reason).
+    Raises TelegramError if the chat's admins can't be fetched.
+    """
+    chat_id = update.effective_chat.id
+    targets, failures = {}, {}
+    usernames, reason_words = [], []
+    duration = None
+    args = list(context.args)
+
+    if update.message.reply_to_message and update.message.reply_to_message.from_user:
+        user = update.message.reply_to_message.from_user
+        targets[f"@{user.username}" if user.username else str(user.id)] = user.id
+
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg.lower() == "recent" and i + 1 < len(args) and parse_duration_arg(args[i + 1]):
+            since = datetime.now() - timedelta(seconds=parse_duration_arg(args[i + 1]))
+            for user_id in await db.get_recent_joins(chat_id, since, BULK_MAX_TARGETS):
+                targets.setdefault(str(user_id), user_id)
+            i += 2
+            continue
+        if arg.startswith("@") and len(arg) > 1:
+            usernames.append(arg)
+        elif arg.isdigit():
+            targets.setdefault(arg, int(arg))
+        elif duration is None and parse_duration_arg(arg):
+            duration = parse_duration_arg(arg)
+        else:
+            reason_words.append(arg)
+        i += 1
+
+    # Bulk targets skip the per-user member lookup; unindexed names are reported
+    user_ids = await asyncio.gather(*(
+        db.get_user_id_by_username(chat_id, name[1:]) for name in usernames
+    ))
+    for name, user_id in zip(usernames, user_ids):
+        if user_id is None:
+            failures[name] = "unknown username"
+        else:
+            targets.setdefault(name, user_id)
+
+    # Never act on admins or the bot itself
+    admin_ids = await get_chat_admin_ids(context.bot, chat_id)
+    for label, user_id in list(targets.items()):
+        if user_id in admin_ids or user_id == context.bot.id:
+            failures[label] = "is an admin"
+            del targets[label]
+
+    return targets, failures, duration, " ".join(reason_words)
+
+async def run_bulk_action(bot, chat_id: int, targets: dict, action, until_date, on_progress):
+    """Apply `action` to every target with at most BULK_CONCURRENCY calls in flight"""
+    semaphore = asyncio.Semaphore(BULK_CONCURRENCY)
+    failures = {}
+    done = 0
+
+    async def apply(label: str, user_id: int):
+        nonlocal done
+        async with semaphore:
+            try:
+                await action(bot, chat_id, user_id, until_date)
+            except TelegramError as e:
+                failures[label] = str(e)
+            except Exception as e:
+                # One bad target (e.g. a storage error) must not abort the others
+                logger.error(f"Bulk action on {label} in {chat_id} failed: {e}")
+                failures[label] = str(e) or type(e).__name__
+            done += 1
+
+    async def report_progress():
+        reported = 0
+        while True:
+            await asyncio.sleep(BULK_PROGRESS_INTERVAL)
+            if done != reported:
+                reported = done
+                await on_progress(done)
+
+    progress = asyncio.create_task(report_progress())
+    try:
+        await asyncio.gather(*(apply(label, user_id) for label, user_id in targets.items()))
+    finally:
+        progress.cancel()
+    return failures
+
+async def bulk_moderate(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/bulkban, /bulkhardban, /bulkkick, /bulkmute for many targets at once"""
+    if not await is_group_admin(update, context):
+        return
+
+    command = update.message.text.split()[0][1:].split("@")[0].lower()
+    action, emoji, verb = BULK_ACTIONS[command]
+    try:
+        targets, failures, duration, reason = await resolve_bulk_targets(update, context)
+    except TelegramError as e:
+        await update.message.reply_text(f"⚠️ Could not check the chat's admins: {e}")
+        return
+
+    usage = (
+        f"ℹ️ <b>Usage:</b> <code>/{command} @user1 @user2 123456789 ...</code>\n"
+        f"or <code>/{command} recent 10m</code> (users who joined in the last 10 minutes)"
+        + ("\nAdd a duration like <code>2h</code> to act temporarily." if command in BULK_TIMED else "")
+    )
+    if not targets and not failures:
+        await update.message.reply_text(usage, parse_mode="HTML")
+        return
+    if duration and command not in BULK_TIMED:
+        await update.message.reply_text(
+            f"⚠️ /{command} takes no duration; use /bulkban or /bulkmute for temporary actions.\n\n"
+            + usage,
+            parse_mode="HTML"
+        )
+        return
+    if len(targets) > BULK_MAX_TARGETS:
+        await update.message.reply_text(f"⚠️ At most {BULK_MAX_TARGETS} targets per command")
+        return
+
+    until_date = None
+    if duration:
+        if duration > 30 * 86400:
+            await update.message.reply_text("⚠️ Maximum duration is 30 days")
+            return
+        until_date = int(time.time()) + duration
+
+    total = len(targets)
+    status = await update.message.reply_text(f"⏳ {verb} 0/{total}...")
+
+    async def on_progress(done: int):
+        try:
+            await status.edit_text(f"⏳ {verb} {done}/{total}...")
+        except TelegramError as e:
+            logger.warning(f"Bulk progress update failed: {e}")
+
+    failures.update(await run_bulk_action(
+        context.bot, update.effective_chat.id, targets, action, until_date, on_progress
+    ))
+
+    succeeded = total - sum(1 for label in failures if label in targets)
+    lines = [f"{emoji} <b>{verb}:</b> {succeeded}/{total} users"]
+    if command in BULK_TIMED:
+        lines.append(f"⏱ <b>Duration:</b> {format_duration(duration) if until_date else 'permanently'}")
+    if reason:
+        lines.append(f"📝 <b>Reason:</b> {html.escape(reason)}")
+    if failures:
+        lines.append("")
+        lines.append(f"❌ <b>Failed ({len(failures)}):</b>")
+        for label, error in list(failures.items())[:BULK_MAX_LISTED_FAILURES]:
+            lines.append(f"- {html.escape(label)}: {html.escape(error)}")
+        if len(failures) > BULK_MAX_LISTED_FAILURES:
+            lines.append(f"...and {len(failures) - BULK_MAX_LISTED_FAILURES} more")
+    text = "\n".join(lines)
+    try:
+        await status.edit_text(text, parse_mode="HTML")
+    except TelegramError:
+        await update.message.reply_text(text, parse_mode="HTML")
+
 
 async def show_usage(update: Update):
     """Show usage instructions"""
@@ -401,11 +715,15 @@ async def show_usage(update: Update):
     )
 
 def setup_admin_handlers(app):
+    timers.register("unban", unban_job)
+    timers.register("expire_warnings", expire_warnings_job)
     app.add_handler(CommandHandler("ban", ban_user))  # Soft ban
     app.add_handler(CommandHandler("hardban", hard_ban))  # Original ban
     app.add_handler(CommandHandler("unban", unban_user))
     app.add_handler(CommandHandler("warn", warn_user))
     app.add_handler(CommandHandler("warnings", check_warnings))
+    app.add_handler(CommandHandler("setwarnlimit", set_warn_limit))
     app.add_handler(CommandHandler("kick", kick_user))
     app.add_handler(CommandHandler("mute", mute_user))
     app.add_handler(CommandHandler("unmute", unmute_user))
+    app.add_handler(CommandHandler(list(BULK_ACTIONS), bulk_moderate))
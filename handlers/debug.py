@@ -0,0 +1,45 @@
+import os
+import asyncio
+from telegram import Update, InputFile
+from telegram.ext import ContextTypes, CommandHandler
+from utils import profiling
+
+ADMIN_USER_ID = int(os.getenv("ADMIN_USER_ID") or 0)
+
+async def debug_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Bot owner diagnostics: /debug profile [seconds] | memory [stop] | tasks"""
+    if not ADMIN_USER_ID or not update.effective_user or update.effective_user.id != ADMIN_USER_ID:
+        return
+
+    action = context.args[0].lower() if context.args else ""
+    try:
+        if action == "profile":
+            seconds = float(context.args[1]) if len(context.args) > 1 else 10
+            await update.message.reply_text(f"⏱ Profiling event loop for {seconds:g}s...")
+            data = await profiling.capture_profile(seconds, as_text=True)
+            filename = "profile.txt"
+        elif action == "memory":
+            if len(context.args) > 1 and context.args[1].lower() == "stop":
+                profiling.stop_tracemalloc()
+                await update.message.reply_text("🧹 tracemalloc stopped")
+                return
+            data = await asyncio.to_thread(profiling.tracemalloc_report)
+            filename = "tracemalloc.txt"
+        elif action == "tasks":
+            data = profiling.dump_tasks()
+            filename = "tasks.txt"
+        else:
+            await update.message.reply_text(
+                "ℹ️ Usage:\n"
+                "/debug profile [seconds]\n"
+                "/debug memory [stop]\n"
+                "/debug tasks"
+            )
+            return
+
+        await update.message.reply_document(InputFile(data, filename=filename))
+    except Exception as e:
+        await update.message.reply_text(f"⚠️ Debug failed: {e}")
+
+def setup_debug_handler(app):
+    app.add_handler(CommandHandler("debug", debug_command))
@@ -0,0 +1,151 @@
+import os
+import time
+import logging
+from array import array
+from collections import OrderedDict
+from telegram import Update, ChatPermissions
+from telegram.error import TelegramError
+from telegram.ext import ContextTypes, MessageHandler, CommandHandler, ApplicationHandlerStop, filters
+from handlers.group import is_group_admin, get_chat_admin_ids, invalidate_member
+from handlers.admin import format_duration
+from database import async_db as db
+from utils.metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+# Default threshold: FLOOD_LIMIT messages within FLOOD_WINDOW seconds (limit 0 = off)
+FLOOD_LIMIT = int(os.getenv("FLOOD_LIMIT", "10"))
+FLOOD_WINDOW = float(os.getenv("FLOOD_WINDOW", "5"))
+FLOOD_MUTE_SECONDS = int(os.getenv("FLOOD_MUTE_SECONDS", "300"))
+FLOOD_MAX_TRACKED = int(os.getenv("FLOOD_MAX_TRACKED", "100000"))
+FLOOD_MAX_LIMIT = 100
+FLOOD_WINDOW_MAX = 300
+FLOOD_GROUP = -2  # Ahead of user tracking and commands
+
+# Format: {(chat_id, user_id): [ring of arrival times, next slot, window, last media_group_id]},
+# least recent first
+_rings = OrderedDict()
+
+FLOOD_MUTES = Counter("ironcore_flood_mutes_total", "Users muted by the flood detector")
+Gauge("ironcore_flood_tracked", "(chat, user) pairs tracked by the flood detector", lambda: len(_rings))
+
+def record_message(key: tuple, limit: int, window: float, now: float, media_group_id: str = None) -> bool:
+    """Record a message; True once `limit` messages arrived within `window`.
+
+    Each pair keeps a ring of its last `limit` arrival times, so a check
+    compares the new message with the one `limit - 1` messages before it.
+    An album arrives as one message per item but counts once. Pairs idle for
+    longer than `window` cannot trip the threshold and are evicted from the
+    cold end as new messages arrive.
+    """
+    entry = _rings.get(key)
+    if entry is None or len(entry[0]) != limit:
+        entry = [array("d", bytes(8 * limit)), 0, window, None]
+        _rings[key] = entry
+    else:
+        entry[2] = window
+        _rings.move_to_end(key)
+        if media_group_id is not None and media_group_id == entry[3]:
+            return False  # Another item of an album already counted
+    entry[3] = media_group_id
+
+    ring, slot, _, _ = entry
+    ring[slot] = now
+    entry[1] = (slot + 1) % limit
+    oldest = ring[entry[1]]  # First of the last `limit` messages, this one included
+
+    # Evict at most two cold entries per message to keep the cost constant
+    for _ in range(2):
+        cold_key, (cold_ring, cold_slot, cold_window, _) = next(iter(_rings.items()))
+        if cold_key == key:
+            break
+        if len(_rings) <= FLOOD_MAX_TRACKED and now - cold_ring[cold_slot - 1] <= cold_window:
+            break
+        del _rings[cold_key]
+
+    if oldest and now - oldest <= window:
+        _rings.pop(key, None)  # Start over after tripping
+        return True
+    return False
+
+async def check_flood(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Mute users who exceed their chat's message rate"""
+    message = update.effective_message
+    user = update.effective_user
+    if not message or not user or user.is_bot:
+        return
+
+    chat_id = update.effective_chat.id
+    settings = await db.get_flood_settings(chat_id)
+    limit, window = settings if settings else (FLOOD_LIMIT, FLOOD_WINDOW)
+    if not limit or not record_message(
+        (chat_id, user.id), limit, window, time.monotonic(), message.media_group_id
+    ):
+        return
+
+    # Rare path: only now pay for the admin lookup
+    try:
+        if user.id in await get_chat_admin_ids(context.bot, chat_id):
+            return
+    except TelegramError as e:
+        logger.warning(f"Flood admin check failed in {chat_id}: {e}")
+        return
+
+    try:
+        await context.bot.restrict_chat_member(
+            chat_id=chat_id,
+            user_id=user.id,
+            permissions=ChatPermissions(
+                can_send_messages=False,
+                can_send_media_messages=False,
+                can_send_other_messages=False,
+                can_add_web_page_previews=False
+            ),
+            until_date=int(time.time()) + FLOOD_MUTE_SECONDS
+        )
+        invalidate_member(chat_id, user.id)
+        FLOOD_MUTES.inc()
+        await message.reply_text(
+            f"🔇 <b>Muted for flooding:</b> {user.mention_html()}\n"
+            f"⏱ <b>Duration:</b> {format_duration(FLOOD_MUTE_SECONDS)}",
+            parse_mode="HTML"
+        )
+    except TelegramError as e:
+        logger.warning(f"Flood mute failed for {user.id} in {chat_id}: {e}")
+    raise ApplicationHandlerStop
+
+async def set_flood(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/setflood <messages> <seconds> | off"""
+    if not await is_group_admin(update, context):
+        await update.message.reply_text("❌ You need to be admin to use this command")
+        return
+
+    args = context.args
+    if args and args[0].lower() == "off":
+        await db.set_flood_settings(update.effective_chat.id, 0, FLOOD_WINDOW)
+        await update.message.reply_text("✅ Flood protection disabled")
+        return
+    try:
+        limit, window = int(args[0]), float(args[1])
+        if not 2 <= limit <= FLOOD_MAX_LIMIT or not 0 < window <= FLOOD_WINDOW_MAX:
+            raise ValueError
+    except (IndexError, ValueError):
+        await update.message.reply_text(
+            "ℹ️ Usage: /setflood <messages> <seconds> or /setflood off\n"
+            "Sending <messages> messages within <seconds> gets a user muted.\n"
+            f"Messages 2-{FLOOD_MAX_LIMIT}, seconds up to {FLOOD_WINDOW_MAX}. "
+            f"Default: {FLOOD_LIMIT} messages in {FLOOD_WINDOW:g}s"
+        )
+        return
+    await db.set_flood_settings(update.effective_chat.id, limit, window)
+    await update.message.reply_text(
+        f"✅ Flood limit set: {limit} messages within {window:g}s gets a user muted"
+    )
+
+def setup_flood_handler(app):
+    # Edits (including live-location refreshes) are not new messages
+    app.add_handler(
+        MessageHandler(filters.ChatType.GROUPS & ~filters.UpdateType.EDITED, check_flood),
+        group=FLOOD_GROUP
+    )
+    app.add_handler(CommandHandler("setflood", set_flood))
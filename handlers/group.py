@@ -1,15 +1,23 @@
 import os
+import asyncio
 import logging
-from telegram import Update
+from telegram import Update, ChatMember, User
+from telegram.error import TelegramError
 from datetime import datetime
-from telegram.ext import ContextTypes, MessageHandler, filters, CommandHandler
-from database.database import (
-    store_join_date, 
-    get_join_date,
-    set_welcome_message,
-    get_welcome_message,
-    set_goodbye_message,
-    get_goodbye_message
+from telegram.ext import ContextTypes, MessageHandler, filters, CommandHandler, ChatMemberHandler
+from database import async_db as db
+from utils.cache import LRUCache
+from utils.metrics import register_cache_metrics
+from utils import timers
+from utils.rate_limiter import PRIORITY_CHATTER, priority_args
+from utils.update_processor import register_membership_hook
+from utils.templates import (
+    TEMPLATE_FIELDS,
+    TemplateError,
+    compile_template,
+    render_template,
+    template_values,
+    group_template_values
 )
 
 
@@ -24,6 +32,35 @@ logger = logging.getLogger(__name__)
 DEFAULT_WELCOME_MSG = "👋 Welcome {mention} to {chat_title}!"
 DEFAULT_GOODBYE_MSG = "👋 {mention} has left {chat_title}!"
 user_join_dates = {}  # Format: {chat_id: {user_id: join_timestamp}}
+ADMIN_STATUSES = {ChatMember.ADMINISTRATOR, ChatMember.OWNER}
+
+# Admin list cache: {chat_id: frozenset(admin_user_ids)}
+ADMIN_CACHE = LRUCache(
+    maxsize=int(os.getenv("ADMIN_CACHE_SIZE", "1000")),
+    ttl=float(os.getenv("ADMIN_CACHE_TTL", "300"))
+)
+_admin_fetches = {}  # Format: {chat_id: in-flight fetch task}
+
+# Recently seen memberships: {(chat_id, user_id): ChatMember}
+MEMBER_CACHE = LRUCache(
+    maxsize=int(os.getenv("MEMBER_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("MEMBER_CACHE_TTL", "60"))
+)
+
+# Last username written to the index: {(chat_id, user_id): username}
+KNOWN_USERNAMES = LRUCache(maxsize=int(os.getenv("USERNAME_MEMO_SIZE", "100000")))
+register_cache_metrics("admins", ADMIN_CACHE)
+register_cache_metrics("members", MEMBER_CACHE)
+register_cache_metrics("usernames", KNOWN_USERNAMES)
+
+# Join bursts are welcomed with one combined message per window
+WELCOME_BATCH_WINDOW = float(os.getenv("WELCOME_BATCH_WINDOW", "3"))
+WELCOME_MAX_MENTIONS = int(os.getenv("WELCOME_MAX_MENTIONS", "20"))
+_pending_welcomes = {}  # Format: {chat_id: {"title": str, "members": {user_id: User}}}
+# Delete welcome messages after this many seconds (0 = keep them)
+WELCOME_DELETE_AFTER = float(os.getenv("WELCOME_DELETE_AFTER", "0"))
+# Banned/kicked since their last join; their queued greetings are skipped: {(chat_id, user_id): True}
+REMOVED_MEMBERS = LRUCache(maxsize=10000, ttl=3600)
 
 async def new_chat_members(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle new members including bot itself"""
@@ -32,41 +69,99 @@ async def new_chat_members(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await auto_upgrade_group(update, context)
         return
     
-    # Store join dates in database
-    for member in update.message.new_chat_members:
-        store_join_date(update.effective_chat.id, member.id)
-    
-    await send_welcome_message(update, context)
+    # Join dates were stored by record_membership when the update arrived
+    queue_welcome(context, update.effective_chat, update.message.new_chat_members)
+
+async def store_join_dates(chat_id: int, members):
+    for member in members:
+        try:
+            await db.store_join_date(chat_id, member.id)
+        except Exception as e:
+            logger.error(f"Error storing join date: {e}")
+
+async def record_membership(update: Update):
+    """Membership hook: index joins/leaves before any later moderation command runs"""
+    message = update.message
+    chat_id = message.chat.id
+    await remember_user(chat_id, message.from_user)
+    await remember_user(chat_id, message.left_chat_member)
+    for member in message.new_chat_members:
+        REMOVED_MEMBERS.pop((chat_id, member.id))  # Rejoined after a kick
+        await remember_user(chat_id, member)
+    await store_join_dates(chat_id, message.new_chat_members)
+
+def skip_welcome(chat_id: int, user_id: int):
+    """Don't welcome a banned or kicked member, even if their join is still queued"""
+    REMOVED_MEMBERS.set((chat_id, user_id), True)
+    batch = _pending_welcomes.get(chat_id)
+    if batch:
+        batch["members"].pop(user_id, None)
+
+def queue_welcome(context: ContextTypes.DEFAULT_TYPE, chat, members):
+    """Add joining members to the chat's pending welcome batch"""
+    members = [member for member in members if not REMOVED_MEMBERS.get((chat.id, member.id))]
+    if not members:
+        return
+    batch = _pending_welcomes.get(chat.id)
+    if batch is None:
+        batch = _pending_welcomes[chat.id] = {"title": chat.title, "members": {}}
+        # Application.stop() waits for these tasks, so batches flush on shutdown
+        context.application.create_task(flush_welcome_batch(chat.id, context.bot))
+    batch["title"] = chat.title
+    for member in members:
+        batch["members"][member.id] = member
 
-def get_user_join_date(chat_id: int, user_id: int) -> datetime:
+async def flush_welcome_batch(chat_id: int, bot):
+    """Wait out the batching window, then welcome everyone in it"""
+    await asyncio.sleep(WELCOME_BATCH_WINDOW)
+    batch = _pending_welcomes.pop(chat_id, None)
+    if not batch or not batch["members"]:
+        return
+    members = list(batch["members"].values())
+    await send_welcome_message(bot, chat_id, batch["title"], members)
+
+async def get_user_join_date(chat_id: int, user_id: int) -> datetime:
     """Get stored join date for a user from database"""
-    return get_join_date(chat_id, user_id)  # Changed to use database
+    return await db.get_join_date(chat_id, user_id)  # Changed to use database
 
 
 
-async def send_welcome_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Send welcome message for new members"""
+async def send_welcome_message(bot, chat_id: int, chat_title: str, members: list):
+    """Send one welcome message for a batch of new members"""
     try:
-        chat_id = update.effective_chat.id
-        welcome_msg = get_welcome_message(chat_id) or DEFAULT_WELCOME_MSG
-        
-        for new_member in update.message.new_chat_members:
-            mention = new_member.mention_html()
-            text = welcome_msg.format(
-                mention=mention,
-                chat_title=update.effective_chat.title,
-                username=new_member.username or "user",
-                first_name=new_member.first_name or "",
-                last_name=new_member.last_name or "",
-                full_name=f"{new_member.first_name or ''} {new_member.last_name or ''}".strip()
+        welcome_msg = await load_template(db.get_welcome_message, chat_id, DEFAULT_WELCOME_MSG)
+        text = render_template(
+            welcome_msg,
+            group_template_values(members, chat_title, WELCOME_MAX_MENTIONS)
+        )
+        message = await bot.send_message(
+            chat_id,
+            text,
+            parse_mode='HTML',
+            rate_limit_args=priority_args(bot, PRIORITY_CHATTER)
+        )
+        if WELCOME_DELETE_AFTER:
+            await timers.schedule_in(
+                "delete_message", chat_id, WELCOME_DELETE_AFTER, {"message_id": message.message_id}
             )
-            await update.message.reply_text(text, parse_mode='HTML')
     except Exception as e:
         logger.error(f"Error sending welcome message: {e}")
 
+async def delete_message_job(bot, chat_id: int, payload: dict):
+    """Timer callback removing a bot message"""
+    try:
+        await bot.delete_message(chat_id, payload["message_id"])
+    except TelegramError as e:
+        # Already deleted, or too old to delete
+        logger.info(f"Scheduled delete of message {payload['message_id']} skipped: {e}")
+
 async def left_chat_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle member leaving the chat"""
     if update.message.left_chat_member.id != context.bot.id:
+        # Don't welcome someone who already left
+        batch = _pending_welcomes.get(update.effective_chat.id)
+        if batch:
+            batch["members"].pop(update.message.left_chat_member.id, None)
         await send_goodbye_message(update, context)
 
 
@@ -74,22 +169,46 @@ async def send_goodbye_message(update: Update, context: ContextTypes.DEFAULT_TYP
     """Send goodbye message for leaving members"""
     try:
         chat_id = update.effective_chat.id
-        goodbye_msg = get_goodbye_message(chat_id) or DEFAULT_GOODBYE_MSG
+        goodbye_msg = await load_template(db.get_goodbye_message, chat_id, DEFAULT_GOODBYE_MSG)
         
         left_member = update.message.left_chat_member
-        mention = left_member.mention_html()
-        text = goodbye_msg.format(
-            mention=mention,
-            chat_title=update.effective_chat.title,
-            username=left_member.username or "user",
-            first_name=left_member.first_name or "",
-            last_name=left_member.last_name or "",
-            full_name=f"{left_member.first_name or ''} {left_member.last_name or ''}".strip()
+        text = render_template(
+            goodbye_msg,
+            template_values(left_member, update.effective_chat.title)
+        )
+        await context.bot.send_message(
+            chat_id,
+            text,
+            parse_mode='HTML',
+            reply_to_message_id=update.message.message_id,
+            allow_sending_without_reply=True,
+            rate_limit_args=priority_args(context.bot, PRIORITY_CHATTER)
         )
-        await update.message.reply_text(text, parse_mode='HTML')
     except Exception as e:
         logger.error(f"Error sending goodbye message: {e}")
 
+async def load_template(getter, chat_id: int, default: str) -> str:
+    """Get a chat's template, falling back to the default if it doesn't compile"""
+    template = await getter(chat_id) or default
+    try:
+        compile_template(template)
+    except TemplateError as e:
+        logger.warning(f"Invalid stored template in chat {chat_id}: {e}")
+        return default
+    return template
+
+async def validate_template(update: Update, template: str) -> bool:
+    """Reject templates with unknown placeholders or broken HTML before they are saved"""
+    try:
+        compile_template(template)
+        return True
+    except TemplateError as e:
+        placeholders = ", ".join(f"{{{field}}}" for field in TEMPLATE_FIELDS)
+        await update.message.reply_text(
+            f"❌ {e}\n\nAvailable placeholders: {placeholders}"
+        )
+        return False
+
 async def set_welcome(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Command to set custom welcome message"""
     if not await is_group_admin(update, context):
@@ -101,7 +220,9 @@ async def set_welcome(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     welcome_msg = ' '.join(context.args)
-    set_welcome_message(update.effective_chat.id, welcome_msg)
+    if not await validate_template(update, welcome_msg):
+        return
+    await db.set_welcome_message(update.effective_chat.id, welcome_msg)
     await update.message.reply_text("✅ Welcome message updated and saved!")
 
 async def set_goodbye(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -115,17 +236,19 @@ async def set_goodbye(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     goodbye_msg = ' '.join(context.args)
-    set_goodbye_message(update.effective_chat.id, goodbye_msg)
+    if not await validate_template(update, goodbye_msg):
+        return
+    await db.set_goodbye_message(update.effective_chat.id, goodbye_msg)
     await update.message.reply_text("✅ Goodbye message updated and saved!")
 
 async def show_welcome(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Command to show current welcome message"""
-    welcome_msg = get_welcome_message(update.effective_chat.id) or DEFAULT_WELCOME_MSG
+    welcome_msg = await db.get_welcome_message(update.effective_chat.id) or DEFAULT_WELCOME_MSG
     await update.message.reply_text(f"Current welcome message:\n\n{welcome_msg}")
 
 async def show_goodbye(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Command to show current goodbye message"""
-    goodbye_msg = get_goodbye_message(update.effective_chat.id) or DEFAULT_GOODBYE_MSG
+    goodbye_msg = await db.get_goodbye_message(update.effective_chat.id) or DEFAULT_GOODBYE_MSG
     await update.message.reply_text(f"Current goodbye message:\n\n{goodbye_msg}")
 
 async def auto_upgrade_group(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -143,12 +266,84 @@ async def is_group_admin(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         return False
     
     try:
-        admins = await context.bot.get_chat_administrators(update.effective_chat.id)
-        return any(admin.user.id == update.effective_user.id for admin in admins)
+        admin_ids = await get_chat_admin_ids(context.bot, update.effective_chat.id)
+        return update.effective_user.id in admin_ids
     except Exception as e:
         logger.error(f"Admin check failed: {e}")
         return False
 
+async def get_chat_admin_ids(bot, chat_id: int) -> frozenset:
+    """Get admin user IDs for a chat, served from cache when fresh"""
+    admin_ids = ADMIN_CACHE.get(chat_id)
+    if admin_ids is not None:
+        return admin_ids
+
+    # Share a single API call between concurrent cache misses
+    task = _admin_fetches.get(chat_id)
+    if task is None:
+        task = asyncio.ensure_future(_fetch_admin_ids(bot, chat_id))
+        _admin_fetches[chat_id] = task
+        task.add_done_callback(lambda _: _admin_fetches.pop(chat_id, None))
+    return await asyncio.shield(task)
+
+async def _fetch_admin_ids(bot, chat_id: int) -> frozenset:
+    admins = await bot.get_chat_administrators(chat_id)
+    admin_ids = frozenset(admin.user.id for admin in admins)
+    ADMIN_CACHE.set(chat_id, admin_ids)
+    for admin in admins:
+        cache_member(chat_id, admin)
+    return admin_ids
+
+def cache_member(chat_id: int, member: ChatMember):
+    MEMBER_CACHE.set((chat_id, member.user.id), member)
+
+def invalidate_member(chat_id: int, user_id: int):
+    """Forget a cached membership after changing it (restrict, ban, unban)"""
+    MEMBER_CACHE.pop((chat_id, user_id))
+
+async def get_chat_member_cached(bot, chat_id: int, user_id: int) -> ChatMember:
+    """getChatMember, served from MEMBER_CACHE when fresh"""
+    member = MEMBER_CACHE.get((chat_id, user_id))
+    if member is None:
+        member = await bot.get_chat_member(chat_id, user_id)
+        cache_member(chat_id, member)
+    return member
+
+async def remember_user(chat_id: int, user: User):
+    """Keep the username index current, writing only when a username changes"""
+    if not user or user.is_bot:
+        return
+    key = (chat_id, user.id)
+    if KNOWN_USERNAMES.get(key, False) == user.username:
+        return
+    await db.store_username(chat_id, user.id, user.username)
+    KNOWN_USERNAMES.set(key, user.username)
+
+async def track_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Passively index message authors and joining/leaving members"""
+    message = update.effective_message
+    chat_id = update.effective_chat.id
+    await remember_user(chat_id, message.from_user)
+    for member in message.new_chat_members:
+        await remember_user(chat_id, member)
+    await remember_user(chat_id, message.left_chat_member)
+
+async def track_chat_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Index member updates and invalidate the admin list on promotion or demotion"""
+    member_update = update.chat_member or update.my_chat_member
+    await remember_user(member_update.chat.id, member_update.new_chat_member.user)
+    cache_member(member_update.chat.id, member_update.new_chat_member)
+
+    was_admin = member_update.old_chat_member.status in ADMIN_STATUSES
+    is_admin = member_update.new_chat_member.status in ADMIN_STATUSES
+    if was_admin != is_admin:
+        ADMIN_CACHE.pop(member_update.chat.id)
+
+
+def target_args(update: Update, context: ContextTypes.DEFAULT_TYPE) -> list:
+    """Command args after the target get_target_user took (@username or user ID), if any"""
+    args = list(context.args or ())
+    return args if update.message.reply_to_message else args[1:]
 
 async def get_target_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """100% Working Group Member Lookup"""
@@ -162,10 +357,19 @@ async def get_target_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if update.message.reply_to_message:
             return update.message.reply_to_message.from_user
 
+        # Numeric user ID: a single API call, no index needed
+        if context.args and context.args[0].isdigit():
+            try:
+                member = await get_chat_member_cached(context.bot, chat.id, int(context.args[0]))
+                return member.user
+            except TelegramError:
+                await update.message.reply_text(f"❌ No member with ID {context.args[0]} in this group")
+                return None
+
         # Require @username format
         if not context.args or not context.args[0].startswith('@'):
             await update.message.reply_text(
-                "🔍 Usage: /info @username\n"
+                "🔍 Usage: /info @username or /info <user ID>\n"
                 "or reply to user's message with /info"
             )
             return None
@@ -176,25 +380,33 @@ async def get_target_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if username.lower() == context.bot.username.lower():
             return context.bot.bot
 
-        # Get ALL group members (this is the reliable way)
-        members = []
-        async for member in context.bot.get_chat_members(chat.id):
-            user = member.user
-            if user.username and user.username.lower() == username.lower():
-                return user
-            members.append(user)
+        # Indexed lookup, confirmed with a single API call
+        user_id = await db.get_user_id_by_username(chat.id, username)
+        if user_id is not None:
+            try:
+                member = await get_chat_member_cached(context.bot, chat.id, user_id)
+                if (member.user.username or "").lower() != username.lower():
+                    # The cached entry may predate a rename; confirm with the API
+                    invalidate_member(chat.id, user_id)
+                    member = await get_chat_member_cached(context.bot, chat.id, user_id)
+                if member.user.username and member.user.username.lower() == username.lower():
+                    return member.user
+                # Username changed since we indexed it
+                await remember_user(chat.id, member.user)
+            except TelegramError as e:
+                logger.warning(f"Indexed lookup for @{username} failed: {e}")
 
-        # If we get here, user wasn't found
+        # The Bot API cannot list members, so only users seen in this chat are known
         await update.message.reply_text(
-            f"🔍 Scanned {len(members)} members\n"
             f"❌ @{username} not found\n\n"
             "ℹ️ Possible reasons:\n"
+            "- User hasn't written here since the bot joined\n"
             "- User left the group\n"
             "- Username changed\n"
             "- Typo in @username\n\n"
             "💡 Try:\n"
             "1. Reply to user's message\n"
-            "2. Check exact @username\n"
+            "2. Use their numeric ID instead of @username\n"
             "3. Ask them to type something",
             parse_mode="HTML"
         )
@@ -212,6 +424,13 @@ async def get_target_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 def setup_group_handlers(application):
     """Set up all group-related handlers"""
+    timers.register("delete_message", delete_message_job)
+    register_membership_hook(record_membership)
+    # Runs ahead of (and alongside) every other group message handler
+    application.add_handler(MessageHandler(
+        filters.ChatType.GROUPS,
+        track_users
+    ), group=-1)
     application.add_handler(MessageHandler(
         filters.StatusUpdate.NEW_CHAT_MEMBERS,
         new_chat_members
@@ -224,3 +443,7 @@ def setup_group_handlers(application):
     application.add_handler(CommandHandler("setgoodbye", set_goodbye))
     application.add_handler(CommandHandler("welcome", show_welcome))
     application.add_handler(CommandHandler("goodbye", show_goodbye))
+    application.add_handler(ChatMemberHandler(
+        track_chat_member,
+        ChatMemberHandler.ANY_CHAT_MEMBER
+    ))
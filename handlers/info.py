@@ -1,7 +1,7 @@
 from telegram import Update
 from telegram.ext import ContextTypes, CommandHandler
-from handlers.group import get_target_user
-from database.database import get_join_date
+from handlers.group import get_target_user, get_chat_member_cached
+from database import async_db as db
 
 async def user_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show detailed information about a user"""
@@ -10,13 +10,11 @@ async def user_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     try:
-        member = await context.bot.get_chat_member(
-            chat_id=update.effective_chat.id,
-            user_id=target.id
-        )
+        # Usually cached by the lookup above or a recent chat_member update
+        member = await get_chat_member_cached(context.bot, update.effective_chat.id, target.id)
         
         # Get join date from our database
-        join_date = get_join_date(update.effective_chat.id, target.id)
+        join_date = await db.get_join_date(update.effective_chat.id, target.id)
         
         message = (
             f"👤 <b>User Information</b>\n\n"
@@ -1,12 +1,32 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response, HTTPException, Header
 import uvicorn
 import os
+import hmac
+import asyncio
+from pathlib import Path
 from dotenv import load_dotenv
+from telegram import Update
+from utils.metrics import REGISTRY, merge_expositions
+from utils.sharding import SHARD_COUNT
+from utils import profiling
 
 # Load environment variables
 load_dotenv()
 
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+# Written by the bot process when the web server runs in a separate process
+METRICS_FILE = os.getenv("METRICS_FILE", "metrics.prom")
+# Bearer token for /debug endpoints; unset disables them
+DEBUG_API_TOKEN = os.getenv("DEBUG_API_TOKEN", "")
+
 web_app = FastAPI()
+telegram_app = None  # Application fed by the webhook (only when served in-process)
+
+def attach_application(application):
+    """Route webhook updates into this Application's update queue"""
+    global telegram_app
+    telegram_app = application
 
 @web_app.get("/")
 def health_check():
@@ -16,6 +36,106 @@ def health_check():
         "environment": os.getenv("ENVIRONMENT")
     }
 
+def sharded_metrics() -> str:
+    """Merge the export files of all shard workers (and the live dispatcher)"""
+    target = Path(METRICS_FILE)
+    bodies = {
+        path.name[len(target.name) + 1:].removeprefix("shard"): path.read_text()
+        for path in sorted(target.parent.glob(target.name + ".*"))
+        if not path.name.endswith(".tmp")
+    }
+    if telegram_app is not None:
+        bodies["dispatcher"] = REGISTRY.render()
+    if not bodies:
+        raise HTTPException(status_code=503, detail="Metrics not exported yet")
+    return merge_expositions(bodies, "shard")
+
+@web_app.get("/metrics")
+async def metrics():
+    """Prometheus metrics, live in-process or from the bot's export file"""
+    if SHARD_COUNT > 1:
+        body = sharded_metrics()
+    elif telegram_app is not None:
+        body = REGISTRY.render()
+    else:
+        try:
+            body = Path(METRICS_FILE).read_text()
+        except FileNotFoundError:
+            raise HTTPException(status_code=503, detail="Metrics not exported yet")
+    return Response(body, media_type="text/plain; version=0.0.4")
+
+@web_app.post(WEBHOOK_PATH)
+async def telegram_webhook(request: Request):
+    """Receive an update from Telegram and queue it for the bot"""
+    if telegram_app is None:
+        raise HTTPException(status_code=503, detail="Bot not attached")
+    token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    if not WEBHOOK_SECRET or not hmac.compare_digest(token, WEBHOOK_SECRET):
+        raise HTTPException(status_code=403, detail="Invalid secret token")
+    update = Update.de_json(await request.json(), telegram_app.bot)
+    await telegram_app.update_queue.put(update)
+    return Response(status_code=200)
+
+def check_debug_access(authorization: str):
+    """Allow /debug only with the configured token, and only next to the bot"""
+    if not DEBUG_API_TOKEN:
+        raise HTTPException(status_code=404)
+    if not hmac.compare_digest(authorization or "", f"Bearer {DEBUG_API_TOKEN}"):
+        raise HTTPException(status_code=401, detail="Invalid token")
+    if telegram_app is None:
+        # A separate web process would only profile itself
+        raise HTTPException(status_code=503, detail="Requires WEB_SERVER_MODE=embedded")
+
+def attachment(data: bytes, filename: str, media_type: str = "text/plain") -> Response:
+    return Response(
+        data,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@web_app.get("/debug/profile")
+async def debug_profile(seconds: float = 10, format: str = "prof",
+                        authorization: str = Header(None)):
+    """cProfile the bot's event loop for a number of seconds"""
+    check_debug_access(authorization)
+    as_text = format == "text"
+    data = await profiling.capture_profile(seconds, as_text=as_text)
+    if as_text:
+        return attachment(data, "profile.txt")
+    return attachment(data, "profile.prof", "application/octet-stream")
+
+@web_app.get("/debug/tracemalloc")
+async def debug_tracemalloc(limit: int = 30, stop: bool = False,
+                            authorization: str = Header(None)):
+    """Allocation snapshot plus diff against the previous one"""
+    check_debug_access(authorization)
+    if stop:
+        profiling.stop_tracemalloc()
+        return {"tracemalloc": "stopped"}
+    data = await asyncio.to_thread(profiling.tracemalloc_report, limit)
+    return attachment(data, "tracemalloc.txt")
+
+@web_app.get("/debug/tasks")
+async def debug_tasks(authorization: str = Header(None)):
+    """Pending asyncio tasks and their stacks"""
+    check_debug_access(authorization)
+    return attachment(profiling.dump_tasks(), "tasks.txt")
+
+class EmbeddedServer(uvicorn.Server):
+    """uvicorn server that leaves signal handling to the host process"""
+
+    def install_signal_handlers(self):
+        pass
+
+def create_embedded_server() -> EmbeddedServer:
+    """Build a uvicorn server to run inside the bot's event loop"""
+    return EmbeddedServer(uvicorn.Config(
+        app=web_app,
+        host=os.getenv("HOST"),
+        port=int(os.getenv("PORT")),
+        log_level="info"
+    ))
+
 def run_web_server():
     uvicorn.run(
         app="handlers.web_server:web_app",
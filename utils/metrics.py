@@ -0,0 +1,290 @@
+import os
+import time
+import asyncio
+import logging
+import functools
+import threading
+from pathlib import Path
+from telegram.ext import ApplicationHandlerStop
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+class Registry:
+    """Holds metrics and renders them in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            try:
+                lines.extend(metric.samples())
+            except Exception as e:
+                logger.error(f"Collecting {metric.name} failed: {e}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+class Counter:
+    """Monotonic counter with optional labels"""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels"""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (),
+                 buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # Format: {labels: [bucket_counts, sum, count]}
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def observe(self, value: float, *labels):
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def time(self, *labels):
+        """Context manager observing the elapsed time of its block"""
+        return _Timer(self, labels)
+
+    def total_count(self) -> int:
+        """Observations across all label sets"""
+        with self._lock:
+            return sum(state[2] for state in self._values.values())
+
+    def samples(self):
+        with self._lock:
+            values = [(labels, list(state[0]), state[1], state[2])
+                      for labels, state in self._values.items()]
+        for labels, counts, total, count in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = _format_labels(self.labelnames, labels, f'le="{bound}"')
+                yield f"{self.name}_bucket{le} {cumulative}"
+            inf = _format_labels(self.labelnames, labels, 'le="+Inf"')
+            yield f"{self.name}_bucket{inf} {count}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}"
+
+class Gauge:
+    """Gauge read from a callback at collection time.
+
+    The callback returns a number, or a dict of {label_values_tuple: number}.
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, func, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.func = func
+        REGISTRY.register(self)
+
+    def samples(self):
+        value = self.func()
+        values = value.items() if isinstance(value, dict) else [((), value)]
+        for labels, number in values:
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(number)}"
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: tuple):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+
+# Bot-wide metrics
+HANDLER_LATENCY = Histogram(
+    "ironcore_handler_seconds", "Handler callback latency", ("handler",)
+)
+HANDLER_ERRORS = Counter(
+    "ironcore_handler_errors_total", "Handler callbacks that raised", ("handler",)
+)
+LOOP_LAG = Histogram(
+    "ironcore_event_loop_lag_seconds", "Event loop scheduling delay",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+)
+
+_caches = {}  # Format: {name: LRUCache}
+Gauge(
+    "ironcore_cache", "LRU cache hits, misses and entries by cache",
+    lambda: {
+        (name, stat): cache.stats()[stat]
+        for name, cache in _caches.items() for stat in ("hits", "misses", "size")
+    },
+    ("cache", "stat")
+)
+
+def register_cache_metrics(name: str, cache):
+    """Export an LRUCache's hit/miss counters and size as ironcore_cache"""
+    _caches[name] = cache
+
+def instrument_handlers(application):
+    """Wrap every registered handler callback with latency/error metrics"""
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            commands = getattr(handler, "commands", None)
+            name = f"/{sorted(commands)[0]}" if commands else handler.callback.__name__
+            # Handlers shared by several commands are labelled per command used
+            shared = commands if commands and len(commands) > 1 else None
+            handler.callback = _timed_callback(handler.callback, name, shared)
+
+def _command_used(update, commands: frozenset):
+    """The command of `commands` an update invoked, or None"""
+    message = getattr(update, "effective_message", None)
+    if not message or not message.text or not message.text.startswith("/"):
+        return None
+    words = message.text[1:].split(maxsplit=1)
+    command = words[0].split("@", 1)[0].lower() if words else ""
+    return command if command in commands else None
+
+def _timed_callback(callback, name: str, commands: frozenset = None):
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        label = name
+        if commands and (command := _command_used(update, commands)):
+            label = f"/{command}"
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except ApplicationHandlerStop:
+            raise
+        except Exception:
+            HANDLER_ERRORS.inc(label)
+            raise
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - started, label)
+    return wrapper
+
+def register_application_metrics(application):
+    """Gauges that read live state from a running Application"""
+    Gauge(
+        "ironcore_update_queue_depth", "Updates waiting in Application.update_queue",
+        lambda: application.update_queue.qsize()
+    )
+    rate_limiter = getattr(application.bot, "rate_limiter", None)
+    if rate_limiter is not None and hasattr(rate_limiter, "stats"):
+        Gauge(
+            "ironcore_outbound", "Outbound scheduler queue depth and counters",
+            lambda: {(key,): value for key, value in rate_limiter.stats().items()},
+            ("stat",)
+        )
+    if hasattr(application, "stats"):
+        Gauge(
+            "ironcore_update_processor", "Chats with queued updates and updates waiting in them",
+            lambda: {(key,): value for key, value in application.stats().items()},
+            ("stat",)
+        )
+
+async def monitor_event_loop_lag(interval: float = 0.5):
+    """Background task sampling how late the event loop wakes up"""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        LOOP_LAG.observe(max(0.0, loop.time() - started - interval))
+
+def write_metrics_file(path: str, body: str):
+    """Atomically replace the metrics file"""
+    target = Path(path)
+    tmp = target.with_name(target.name + ".tmp")
+    tmp.write_text(body)
+    os.replace(tmp, target)
+
+async def export_metrics_file(path: str, interval: float = 5):
+    """Background task publishing metrics for a web server in another process"""
+    while True:
+        try:
+            # Collect on the loop (gauges read loop state), write off it
+            await asyncio.to_thread(write_metrics_file, path, REGISTRY.render())
+        except Exception as e:
+            logger.error(f"Metrics export failed: {e}")
+        await asyncio.sleep(interval)
+
+def _with_label(sample: str, name: str, value: str) -> str:
+    label = f'{name}="{_escape(value)}"'
+    brace, space = sample.find("{"), sample.find(" ")
+    if brace != -1 and brace < space:
+        return f"{sample[:brace + 1]}{label},{sample[brace + 1:]}"
+    return f"{sample[:space]}{{{label}}}{sample[space:]}"
+
+def merge_expositions(bodies: dict, label: str) -> str:
+    """Combine text expositions from several processes into one.
+
+    Samples from each {source: body} get a `label`="source" label and are
+    regrouped per metric family, as the text format requires.
+    """
+    families = {}  # Format: {family name: ([HELP/TYPE lines], [samples])}
+    for source, body in bodies.items():
+        family = None
+        for line in body.splitlines():
+            if not line:
+                continue
+            if line.startswith("# "):
+                family = families.setdefault(line.split(" ", 3)[2], ([], []))
+                if line not in family[0]:
+                    family[0].append(line)
+            elif family is not None:
+                family[1].append(_with_label(line, label, source))
+    lines = []
+    for comments, samples in families.values():
+        lines.extend(comments)
+        lines.extend(samples)
+    return "\n".join(lines) + "\n"
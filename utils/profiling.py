@@ -0,0 +1,76 @@
+import io
+import time
+import pstats
+import asyncio
+import cProfile
+import marshal
+import tracemalloc
+
+MAX_PROFILE_SECONDS = 120
+TRACEMALLOC_FRAMES = 10
+
+_profile_lock = asyncio.Lock()
+_last_snapshot = None
+
+async def capture_profile(seconds: float, as_text: bool = False) -> bytes:
+    """Profile everything the event loop runs for `seconds`.
+
+    Returns a .prof file (pstats/snakeviz format) or a text report.
+    """
+    seconds = max(1.0, min(float(seconds), MAX_PROFILE_SECONDS))
+    async with _profile_lock:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.disable()
+    profiler.create_stats()
+    if not as_text:
+        return marshal.dumps(profiler.stats)
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(60)
+    return out.getvalue().encode()
+
+def tracemalloc_report(limit: int = 30) -> bytes:
+    """Snapshot allocations and diff against the previous snapshot.
+
+    The first call starts tracing; later calls report top allocators and
+    the growth since the last call.
+    """
+    global _last_snapshot
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+        _last_snapshot = tracemalloc.take_snapshot()
+        return b"tracemalloc started; request again to get a snapshot and diff\n"
+
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ))
+    current, peak = tracemalloc.get_traced_memory()
+    lines = [f"Traced memory: current {current / 1024:.1f} KiB, peak {peak / 1024:.1f} KiB", ""]
+    lines.append(f"Top {limit} allocators:")
+    lines.extend(str(stat) for stat in snapshot.statistics("lineno")[:limit])
+    if _last_snapshot is not None:
+        lines.append("")
+        lines.append(f"Top {limit} changes since previous snapshot:")
+        lines.extend(str(stat) for stat in snapshot.compare_to(_last_snapshot, "lineno")[:limit])
+    _last_snapshot = snapshot
+    return ("\n".join(lines) + "\n").encode()
+
+def stop_tracemalloc():
+    global _last_snapshot
+    tracemalloc.stop()
+    _last_snapshot = None
+
+def dump_tasks() -> bytes:
+    """List pending asyncio tasks of the running loop with their stacks"""
+    out = io.StringIO()
+    tasks = sorted(asyncio.all_tasks(), key=lambda task: task.get_name())
+    out.write(f"{len(tasks)} pending tasks at {time.strftime('%Y-%m-%d %H:%M:%S')}\n\n")
+    for task in tasks:
+        out.write(f"=== {task.get_name()}: {task.get_coro()!r}\n")
+        task.print_stack(file=out)
+        out.write("\n")
+    return out.getvalue().encode()
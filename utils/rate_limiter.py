@@ -0,0 +1,208 @@
+import os
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+from utils.metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+API_CALLS = Counter("ironcore_api_calls_total", "Bot API calls by method", ("method",))
+API_ERRORS = Counter(
+    "ironcore_api_errors_total", "Failed Bot API calls by method and error", ("method", "error")
+)
+API_LATENCY = Histogram("ironcore_api_seconds", "Bot API call latency by method", ("method",))
+
+# Priority lanes (lower runs first)
+PRIORITY_MODERATION = 0
+PRIORITY_DEFAULT = 1
+PRIORITY_CHATTER = 2  # Welcome/goodbye and other non-urgent messages
+
+MODERATION_ENDPOINTS = {
+    "banChatMember",
+    "unbanChatMember",
+    "restrictChatMember",
+    "deleteMessage",
+}
+# Endpoints that post into a chat and count against its per-chat limit
+CHAT_ENDPOINT_PREFIXES = ("send", "forwardMessage", "copyMessage")
+
+# Telegram's bot-wide send limit; sharded workers each get an equal slice
+OUTBOUND_GLOBAL_PER_SECOND = float(os.getenv("OUTBOUND_GLOBAL_PER_SECOND", "30"))
+# Separate budget for calls the send limit doesn't cover (lookups, edits, callback answers)
+OUTBOUND_OTHER_PER_SECOND = float(os.getenv("OUTBOUND_OTHER_PER_SECOND", "100"))
+
+def uses_send_limit(endpoint: str) -> bool:
+    """Whether a call counts against Telegram's bot-wide send limit"""
+    return endpoint.startswith(CHAT_ENDPOINT_PREFIXES) or endpoint in MODERATION_ENDPOINTS
+
+def priority_args(bot, priority: int) -> dict:
+    """rate_limit_args for a bot call, or None if the bot has no rate limiter"""
+    return {"priority": priority} if getattr(bot, "rate_limiter", None) else None
+
+class TokenBucket:
+    """Token bucket whose waiters are served in priority order"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._waiters = []  # Heap of (priority, seq, future)
+        self._seq = itertools.count()
+        self._timer = None
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    @property
+    def idle(self) -> bool:
+        self._refill()
+        return not self._waiters and self.tokens >= self.capacity
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, priority: int = PRIORITY_DEFAULT):
+        """Take one token, waiting behind higher-priority requests if empty"""
+        self._refill()
+        if not self._waiters and self.tokens >= 1:
+            self.tokens -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        self._schedule()
+        await future
+
+    def pause(self, seconds: float):
+        """Block the bucket for a while (e.g. after RetryAfter)"""
+        self._refill()
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._schedule()
+
+    def _schedule(self):
+        if self._timer is None and self._waiters:
+            delay = max(0.0, (1 - self.tokens) / self.rate)
+            self._timer = asyncio.get_running_loop().call_later(delay, self._wake)
+
+    def _wake(self):
+        self._timer = None
+        self._refill()
+        while self._waiters and self.tokens >= 1:
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():  # Waiter was cancelled
+                continue
+            self.tokens -= 1
+            future.set_result(None)
+        self._schedule()
+
+class OutboundScheduler(BaseRateLimiter):
+    """Throttles sends and moderation with a global bucket plus one bucket per chat.
+
+    Other calls (getChatMember, editMessageText, answerCallbackQuery, ...) draw
+    from their own budget so they never wait behind a send backlog.
+
+    Pass ``rate_limit_args={"priority": PRIORITY_CHATTER}`` (or another lane) to
+    an ``ExtBot`` method to override the endpoint's default priority.
+    """
+
+    def __init__(
+        self,
+        global_per_second: float = OUTBOUND_GLOBAL_PER_SECOND,
+        other_per_second: float = OUTBOUND_OTHER_PER_SECOND,
+        group_per_minute: float = float(os.getenv("OUTBOUND_GROUP_PER_MINUTE", "20")),
+        private_per_second: float = float(os.getenv("OUTBOUND_PRIVATE_PER_SECOND", "1")),
+        max_retries: int = int(os.getenv("OUTBOUND_MAX_RETRIES", "3")),
+        max_chat_buckets: int = 10000
+    ):
+        self.global_per_second = global_per_second
+        self.other_per_second = other_per_second
+        self.group_per_minute = group_per_minute
+        self.private_per_second = private_per_second
+        self.max_retries = max_retries
+        self.max_chat_buckets = max_chat_buckets
+        self._global = None
+        self._other = None
+        self._chats = {}  # Format: {chat_id: TokenBucket}
+        self.sent = 0
+        self.retry_after_count = 0
+        self.in_flight = 0
+
+    async def initialize(self):
+        self._global = TokenBucket(self.global_per_second, self.global_per_second)
+        self._other = TokenBucket(self.other_per_second, self.other_per_second)
+
+    async def shutdown(self):
+        self._chats.clear()
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self.max_chat_buckets:
+                self._chats = {k: b for k, b in self._chats.items() if not b.idle}
+            if isinstance(chat_id, int) and chat_id > 0:
+                bucket = TokenBucket(self.private_per_second, self.private_per_second)
+            else:
+                bucket = TokenBucket(self.group_per_minute / 60, self.group_per_minute)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def stats(self) -> dict:
+        """Queue depth and counters for monitoring"""
+        return {
+            "global_queue": self._global.queued if self._global else 0,
+            "other_queue": self._other.queued if self._other else 0,
+            "chat_queue": sum(bucket.queued for bucket in self._chats.values()),
+            "chat_buckets": len(self._chats),
+            "in_flight": self.in_flight,
+            "sent": self.sent,
+            "retry_after": self.retry_after_count
+        }
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        if self._global is None:
+            await self.initialize()
+
+        priority = PRIORITY_MODERATION if endpoint in MODERATION_ENDPOINTS else PRIORITY_DEFAULT
+        if isinstance(rate_limit_args, dict):
+            priority = rate_limit_args.get("priority", priority)
+
+        bucket = self._global if uses_send_limit(endpoint) else self._other
+        chat_id = data.get("chat_id")
+        chat_bucket = None
+        if chat_id is not None and endpoint.startswith(CHAT_ENDPOINT_PREFIXES):
+            chat_bucket = self._chat_bucket(chat_id)
+
+        for attempt in itertools.count():
+            if chat_bucket is not None:
+                await chat_bucket.acquire(priority)
+            await bucket.acquire(priority)
+            self.in_flight += 1
+            API_CALLS.inc(endpoint)
+            started = time.perf_counter()
+            try:
+                result = await callback(*args, **kwargs)
+                self.sent += 1
+                return result
+            except RetryAfter as e:
+                API_ERRORS.inc(endpoint, "RetryAfter")
+                self.retry_after_count += 1
+                if attempt >= self.max_retries:
+                    raise
+                logger.warning(f"{endpoint} hit flood limit, retrying in {e.retry_after}s")
+                (chat_bucket or bucket).pause(e.retry_after)
+            except Exception as e:
+                API_ERRORS.inc(endpoint, type(e).__name__)
+                raise
+            finally:
+                API_LATENCY.observe(time.perf_counter() - started, endpoint)
+                self.in_flight -= 1
@@ -0,0 +1,36 @@
+"""Chat-keyed sharding across worker processes.
+
+Every update of a chat goes to the same shard, so all chat-keyed state (caches,
+flood counters, welcome batches, timer jobs) lives in exactly one process and
+SQLite is the only state the shards share.
+"""
+import os
+from pathlib import Path
+
+# Worker processes; 1 keeps the classic single-process bot
+SHARD_COUNT = max(1, int(os.getenv("SHARD_COUNT", "1")))
+
+_shard_index = 0
+
+def set_shard(index: int):
+    """Declare which shard this process serves (call before starting anything)"""
+    global _shard_index
+    _shard_index = index
+
+def shard_index() -> int:
+    return _shard_index
+
+def shard_for_chat(chat_id: int) -> int:
+    # abs() keeps Python and SQLite (truncating %) in agreement for negative IDs
+    return abs(chat_id) % SHARD_COUNT
+
+def shard_for_update(update) -> int:
+    """Route by chat, falling back to the user for chat-less updates"""
+    if update.effective_chat:
+        return shard_for_chat(update.effective_chat.id)
+    if update.effective_user:
+        return shard_for_chat(update.effective_user.id)
+    return 0
+
+def shard_lock_path(index: int) -> Path:
+    return Path(f"bot_shard_{index}.lock")
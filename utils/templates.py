@@ -0,0 +1,112 @@
+import html
+from functools import lru_cache
+from html.parser import HTMLParser
+from string import Formatter
+
+# Placeholders allowed in welcome/goodbye templates
+TEMPLATE_FIELDS = ("mention", "chat_title", "username", "first_name", "last_name", "full_name")
+# Tags and named entities Telegram's HTML parse mode accepts
+TELEGRAM_TAGS = frozenset({
+    "b", "strong", "i", "em", "u", "ins", "s", "strike", "del", "span", "tg-spoiler",
+    "a", "tg-emoji", "code", "pre", "blockquote",
+})
+TELEGRAM_ENTITIES = frozenset({"lt", "gt", "amp", "quot"})
+# Placeholder values used to check a template's rendered markup
+SAMPLE_VALUES = dict(
+    {field: "Sample" for field in TEMPLATE_FIELDS},
+    mention='<a href="tg://user?id=1">Sample</a>'
+)
+
+class TemplateError(ValueError):
+    """Raised when a welcome/goodbye template can't be used"""
+
+class _MarkupChecker(HTMLParser):
+    """Raises TemplateError on markup Telegram would refuse to send"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.open_tags = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag not in TELEGRAM_TAGS:
+            raise TemplateError(f"Unsupported HTML tag <{tag}>")
+        self.open_tags.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        raise TemplateError(f"Unsupported HTML tag <{tag}/>")
+
+    def handle_endtag(self, tag):
+        if not self.open_tags or self.open_tags[-1] != tag:
+            raise TemplateError(f"Unexpected closing tag </{tag}>")
+        self.open_tags.pop()
+
+    def handle_entityref(self, name):
+        if name not in TELEGRAM_ENTITIES:
+            raise TemplateError(f"Unsupported HTML entity &{name};")
+
+    def handle_data(self, data):
+        if "<" in data or "&" in data:
+            raise TemplateError("Use &lt; and &amp; for literal < and &")
+
+    def check(self, text: str):
+        self.feed(text)
+        self.close()
+        if self.open_tags:
+            raise TemplateError(f"Unclosed HTML tag <{self.open_tags[-1]}>")
+
+def check_markup(text: str):
+    """Raise TemplateError unless Telegram's HTML parse mode accepts `text`"""
+    _MarkupChecker().check(text)
+
+@lru_cache(maxsize=4096)
+def compile_template(text: str) -> tuple:
+    """Parse a template once into (literal, field) pairs, rejecting unknown fields"""
+    parts = []
+    try:
+        for literal, field, spec, conversion in Formatter().parse(text):
+            if field is not None:
+                if field not in TEMPLATE_FIELDS:
+                    raise TemplateError(f"Unknown placeholder {{{field}}}")
+                if spec or conversion:
+                    raise TemplateError(f"Formatting is not supported in {{{field}}}")
+            parts.append((literal, field))
+    except TemplateError:
+        raise
+    except ValueError as e:
+        raise TemplateError(f"Malformed template: {e}") from e
+    # Sent with parse_mode=HTML, so broken markup would fail on every join/leave
+    check_markup("".join(literal + SAMPLE_VALUES[field] if field else literal for literal, field in parts))
+    return tuple(parts)
+
+def render_template(text: str, values: dict) -> str:
+    """Fill a template with values from template_values()"""
+    return "".join(
+        literal + values[field] if field else literal
+        for literal, field in compile_template(text)
+    )
+
+def template_values(user, chat_title: str) -> dict:
+    """Build HTML-safe placeholder values for a user"""
+    first_name = user.first_name or ""
+    last_name = user.last_name or ""
+    return {
+        "mention": user.mention_html(),  # Already escaped by telegram
+        "chat_title": html.escape(chat_title or ""),
+        "username": html.escape(user.username or "user"),
+        "first_name": html.escape(first_name),
+        "last_name": html.escape(last_name),
+        "full_name": html.escape(f"{first_name} {last_name}".strip())
+    }
+
+def group_template_values(users: list, chat_title: str, max_mentions: int) -> dict:
+    """Build placeholder values that list several users at once"""
+    if len(users) == 1:
+        return template_values(users[0], chat_title)
+    listed = [template_values(user, chat_title) for user in users[:max_mentions]]
+    extra = len(users) - len(listed)
+    values = {}
+    for field in TEMPLATE_FIELDS:
+        joined = ", ".join(entry[field] for entry in listed)
+        values[field] = f"{joined} and {extra} more" if extra else joined
+    values["chat_title"] = html.escape(chat_title or "")
+    return values
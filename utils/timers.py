@@ -0,0 +1,191 @@
+"""Persistent timers: SQLite holds every job, a windowed heap the imminent ones.
+
+Only jobs due within TIMER_WINDOW seconds are kept in memory, so the heap stays
+small however many jobs are scheduled further out. One task sleeps until the
+earliest job (or the next window refill) and runs due jobs. Jobs are deleted
+after their callback finishes; a crash before that re-runs them on the next
+start, so callbacks must be idempotent. A callback that raises is retried
+with exponential backoff and dropped after TIMER_MAX_ATTEMPTS runs.
+"""
+import os
+import json
+import time
+import heapq
+import asyncio
+import logging
+from telegram.error import BadRequest, RetryAfter
+from database import async_db as db
+from utils.metrics import Gauge
+from utils import sharding
+
+logger = logging.getLogger(__name__)
+
+TIMER_WINDOW = float(os.getenv("TIMER_WINDOW", "300"))
+TIMER_CONCURRENCY = int(os.getenv("TIMER_CONCURRENCY", "20"))
+TIMER_MAX_ATTEMPTS = int(os.getenv("TIMER_MAX_ATTEMPTS", "6"))
+TIMER_RETRY_BASE = 30  # Seconds before the first retry, doubling after each failure
+TIMER_RETRY_MAX = 3600
+TIMER_ERROR_DELAY = 5  # Seconds before the engine retries after a storage error
+
+# Format: {kind: async callback(bot, chat_id, payload)}
+_callbacks = {}
+_heap = []  # (run_at, job_id, kind, chat_id, payload, attempts)
+_queued = set()  # IDs in the heap that are still due to run
+_finished = []  # IDs to delete from storage
+_window_end = 0.0
+_loading_end = 0.0  # End of the range being read while a load is in flight
+_wake = asyncio.Event()
+_task = None
+_running = set()
+_semaphore = None
+
+Gauge("ironcore_timers_loaded", "Timer jobs held in the in-memory window", lambda: len(_queued))
+
+def _encode(payload: dict) -> str:
+    return json.dumps(payload or {}, sort_keys=True, separators=(",", ":"))
+
+def register(kind: str, callback):
+    """Set the coroutine run for jobs of `kind`"""
+    _callbacks[kind] = callback
+
+def _push(job_id: int, kind: str, chat_id: int, run_at: float, payload: str, attempts: int = 0):
+    if job_id in _queued:
+        return
+    _queued.add(job_id)
+    heapq.heappush(_heap, (run_at, job_id, kind, chat_id, payload, attempts))
+
+async def schedule(kind: str, chat_id: int, run_at: float, payload: dict = None) -> int:
+    """Persist a job to run at `run_at` (unix time); returns its ID"""
+    encoded = _encode(payload)
+    job_id = await db.add_scheduled_job(kind, chat_id, run_at, encoded)
+    if run_at < max(_window_end, _loading_end):
+        _push(job_id, kind, chat_id, run_at, encoded)
+        if _heap[0][1] == job_id:
+            _wake.set()
+    return job_id
+
+async def schedule_in(kind: str, chat_id: int, delay: float, payload: dict = None) -> int:
+    return await schedule(kind, chat_id, time.time() + delay, payload)
+
+async def cancel(kind: str, chat_id: int, payload: dict = None) -> int:
+    """Cancel pending jobs matching kind, chat and payload; returns how many"""
+    job_ids = await db.delete_scheduled_jobs_of_kind(kind, chat_id, _encode(payload))
+    _queued.difference_update(job_ids)  # Heap entries are skipped lazily
+    return len(job_ids)
+
+async def _load(end: float):
+    """Extend the in-memory window up to `end`; on failure the window stays put"""
+    global _window_end, _loading_end
+    # Jobs scheduled during the read are pushed directly, in case the read misses them
+    _loading_end = end
+    try:
+        # Each shard runs the jobs of its own chats
+        jobs = await db.get_scheduled_jobs(_window_end, end, sharding.shard_index(), sharding.SHARD_COUNT)
+    finally:
+        _loading_end = 0.0
+    for job_id, kind, chat_id, run_at, payload, attempts in jobs:
+        _push(job_id, kind, chat_id, run_at, payload, attempts)
+    _window_end = end
+
+async def _retry(job_id: int, kind: str, chat_id: int, payload: str, attempts: int, error: Exception):
+    """Reschedule a failed job with backoff, or drop it after TIMER_MAX_ATTEMPTS runs"""
+    attempts += 1
+    if attempts >= TIMER_MAX_ATTEMPTS or isinstance(error, BadRequest):  # BadRequest won't heal
+        logger.error(f"Timer job {job_id} ({kind}) failed {attempts} times; dropping it: {error}")
+        _finished.append(job_id)
+        return
+    delay = min(TIMER_RETRY_MAX, TIMER_RETRY_BASE * 2 ** (attempts - 1))
+    if isinstance(error, RetryAfter):
+        delay = max(delay, error.retry_after)
+    logger.warning(f"Timer job {job_id} ({kind}) failed, retry {attempts} in {delay:g}s: {error}")
+    run_at = time.time() + delay
+    try:
+        if await db.reschedule_scheduled_job(job_id, run_at, attempts) and run_at < max(_window_end, _loading_end):
+            _push(job_id, kind, chat_id, run_at, payload, attempts)
+            _wake.set()
+    except Exception as e:
+        # The row keeps its old run_at and runs again on the next start
+        logger.error(f"Failed to reschedule timer job {job_id}: {e}")
+
+async def _execute(bot, job_id: int, kind: str, chat_id: int, payload: str, attempts: int):
+    async with _semaphore:
+        callback = _callbacks.get(kind)
+        if callback is None:
+            logger.warning(f"No callback registered for timer kind {kind!r}; dropping job {job_id}")
+            _finished.append(job_id)
+            return
+        try:
+            await callback(bot, chat_id, json.loads(payload))
+        except Exception as e:
+            await _retry(job_id, kind, chat_id, payload, attempts, e)
+            return
+        _finished.append(job_id)
+
+async def _flush_finished():
+    if _finished:
+        job_ids = _finished[:]
+        _finished.clear()
+        try:
+            await db.delete_scheduled_jobs(job_ids)
+        except Exception:
+            _finished.extend(job_ids)  # Retried on the next pass
+            raise
+
+async def _tick(bot) -> float:
+    """Refill the window, start due jobs and delete finished ones; returns the next wake-up"""
+    now = time.time()
+    if now + TIMER_WINDOW / 2 >= _window_end:
+        await _load(now + TIMER_WINDOW)
+
+    while _heap and _heap[0][0] <= now:
+        run_at, job_id, kind, chat_id, payload, attempts = heapq.heappop(_heap)
+        if job_id not in _queued:
+            continue  # Cancelled
+        _queued.discard(job_id)
+        task = asyncio.create_task(_execute(bot, job_id, kind, chat_id, payload, attempts))
+        _running.add(task)
+        task.add_done_callback(_running.discard)
+
+    await _flush_finished()
+
+    next_wake = _window_end - TIMER_WINDOW / 2
+    if _heap:
+        next_wake = min(next_wake, _heap[0][0])
+    return next_wake
+
+async def _run(bot):
+    while True:
+        _wake.clear()
+        try:
+            next_wake = await _tick(bot)
+        except Exception as e:
+            # Keep the engine alive through storage errors; the next pass retries
+            logger.error(f"Timer engine error, retrying in {TIMER_ERROR_DELAY}s: {e}")
+            next_wake = time.time() + TIMER_ERROR_DELAY
+        try:
+            await asyncio.wait_for(_wake.wait(), max(0.0, next_wake - time.time()))
+        except asyncio.TimeoutError:
+            pass
+
+def start(bot):
+    """Load pending jobs and start the wake-up task (call from the event loop)"""
+    global _task, _semaphore, _wake
+    if _task is None:
+        _wake = asyncio.Event()
+        _semaphore = asyncio.Semaphore(TIMER_CONCURRENCY)
+        _task = asyncio.create_task(_run(bot))
+
+async def stop():
+    """Stop the engine; jobs still running are cancelled and will re-run on start"""
+    global _task, _window_end
+    if _task is None:
+        return
+    _task.cancel()
+    for task in list(_running):
+        task.cancel()
+    await asyncio.gather(_task, *_running, return_exceptions=True)
+    await _flush_finished()
+    _task = None
+    _heap.clear()
+    _queued.clear()
+    _window_end = 0.0
@@ -0,0 +1,252 @@
+"""Application that runs each chat's updates in order, most urgent class first.
+
+With plain concurrent_updates every update starts as soon as it is fetched,
+so two updates from one chat can interleave (two /warns both reading the old
+count, a goodbye overtaking its welcome). Here updates are queued per chat
+and one task drains each chat's queue, while different chats still run in
+parallel. The Application's concurrent_updates limit caps how many updates
+run at once across all chats.
+
+Updates fall into the outbound scheduler's priority classes: moderation
+commands, then everything else, then join/leave greetings. Within a chat,
+order is kept per class and a more urgent class runs first; across chats,
+free slots go to the most urgent waiter. When the bot falls behind,
+greetings older than STALE_UPDATE_SECONDS are shed instead of run.
+
+Join/leave bookkeeping (join dates, usernames) must not fall behind like
+their greetings do: moderation such as /bulkban recent relies on it. Each
+join/leave therefore also queues its membership hooks in the moderation
+lane, at its arrival position, so no later command can overtake them.
+Arrival hooks (the update recorder) see every update as it is fetched,
+before it is queued or shed.
+"""
+import os
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+from collections import deque
+from telegram import Update
+from telegram.ext import Application
+from telegram.ext._application import _STOP_SIGNAL  # Sentinel Application.stop() enqueues
+from utils.metrics import Counter
+from utils.rate_limiter import PRIORITY_MODERATION, PRIORITY_DEFAULT, PRIORITY_CHATTER
+
+logger = logging.getLogger(__name__)
+
+# Updates handled at once across all chats
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "64"))
+# Updates a single chat may have waiting; beyond it the least urgent are shed
+CHAT_QUEUE_LIMIT = int(os.getenv("CHAT_QUEUE_LIMIT", "200"))
+# Greetings for joins/leaves older than this are skipped (0 = never)
+STALE_UPDATE_SECONDS = float(os.getenv("STALE_UPDATE_SECONDS", "120"))
+
+MODERATION_COMMANDS = frozenset({
+    "ban", "hardban", "unban", "kick", "mute", "unmute", "warn", "setflood", "setwarnlimit",
+    "bulkban", "bulkhardban", "bulkkick", "bulkmute",
+})
+PRIORITY_NAMES = {
+    PRIORITY_MODERATION: "moderation",
+    PRIORITY_DEFAULT: "default",
+    PRIORITY_CHATTER: "chatter",
+}
+
+UPDATES_SHED = Counter(
+    "ironcore_updates_shed_total", "Updates skipped under load by reason and priority class",
+    ("reason", "priority")
+)
+
+_membership_hooks = []
+_arrival_hooks = []
+
+def register_arrival_hook(callback):
+    """Call `callback(update)` as each update arrives, before queueing or shedding"""
+    if callback not in _arrival_hooks:
+        _arrival_hooks.append(callback)
+
+def register_membership_hook(callback):
+    """Run coroutine `callback(update)` for every join/leave, in order with moderation"""
+    if callback not in _membership_hooks:
+        _membership_hooks.append(callback)
+
+class _MembershipStep:
+    """Lane entry running the membership hooks of a join/leave update"""
+    __slots__ = ("update",)
+
+    def __init__(self, update: Update):
+        self.update = update
+
+def update_chat_key(update: object):
+    """Ordering key: the chat, else the user; None runs the update unordered"""
+    if not isinstance(update, Update):
+        return None
+    if update.effective_chat:
+        return update.effective_chat.id
+    if update.effective_user:
+        return update.effective_user.id
+    return None
+
+def update_priority(update: object, bot_id: int) -> int:
+    """Priority class of an incoming update (lower runs first)"""
+    message = update.message if isinstance(update, Update) else None
+    if message is None:
+        return PRIORITY_DEFAULT
+    if message.text and message.text.startswith("/"):
+        command = message.text[1:].split("@", 1)[0].split(maxsplit=1)
+        command = command[0].lower() if command else ""
+        return PRIORITY_MODERATION if command in MODERATION_COMMANDS else PRIORITY_DEFAULT
+    if message.left_chat_member:
+        return PRIORITY_CHATTER
+    if message.new_chat_members:
+        # The bot being added sets the group up; that is never optional
+        if any(member.id == bot_id for member in message.new_chat_members):
+            return PRIORITY_DEFAULT
+        return PRIORITY_CHATTER
+    return PRIORITY_DEFAULT
+
+def is_membership_update(update: object) -> bool:
+    message = update.message if isinstance(update, Update) else None
+    return message is not None and bool(message.new_chat_members or message.left_chat_member)
+
+def is_stale(update: object, priority: int, now: float) -> bool:
+    """Greeting-class update that Telegram received over STALE_UPDATE_SECONDS ago"""
+    if priority != PRIORITY_CHATTER or not STALE_UPDATE_SECONDS:
+        return False
+    message = update.effective_message
+    return message is not None and now - message.date.timestamp() > STALE_UPDATE_SECONDS
+
+class PrioritySemaphore:
+    """Semaphore whose waiters are woken in priority order"""
+
+    def __init__(self, value: int):
+        self._value = value
+        self._waiters = []  # Heap of (priority, seq, future)
+        self._seq = itertools.count()
+
+    @property
+    def waiting(self) -> int:
+        return sum(not future.done() for _, _, future in self._waiters)
+
+    async def acquire(self, priority: int = PRIORITY_DEFAULT):
+        if self._value > 0 and not self._waiters:
+            self._value -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()  # Woken and cancelled at once: pass the slot on
+            raise
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._value += 1
+
+class ChatOrderedApplication(Application):
+    """Application whose update fetcher keeps per-chat order"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # Format: {chat_id: [deque per priority class]}, present while the chat is being drained
+        self._chat_queues = {}
+        self._slots = PrioritySemaphore(self.concurrent_updates or 1)
+
+    def stats(self) -> dict:
+        return {
+            "active_chats": len(self._chat_queues),
+            "queued": sum(len(lane) for lanes in self._chat_queues.values() for lane in lanes),
+            "waiting_for_slot": self._slots.waiting,
+        }
+
+    async def _update_fetcher(self):
+        while True:
+            try:
+                update = await self.update_queue.get()
+                if update is _STOP_SIGNAL:
+                    # Same as Application: pending updates are dropped on stop
+                    while not self.update_queue.empty():
+                        self.update_queue.task_done()
+                    self.update_queue.task_done()
+                    return
+                for callback in _arrival_hooks:
+                    try:
+                        callback(update)
+                    except Exception as e:
+                        logger.error(f"Arrival hook {callback.__name__} failed: {e}")
+                self._dispatch(update)
+            except asyncio.CancelledError:
+                # Only Application.stop() may end this loop
+                logger.warning("Update fetcher got CancelledError; ignoring until Application.stop")
+
+    def _dispatch(self, update: object):
+        priority = update_priority(update, self.bot.id)
+        key = update_chat_key(update)
+        if key is None:
+            self.create_task(self._run_update(update, priority))
+            return
+
+        lanes = self._chat_queues.get(key)
+        if lanes is None:
+            lanes = self._chat_queues[key] = [deque() for _ in PRIORITY_NAMES]
+            self.create_task(self._drain_chat(key))
+        if _membership_hooks and is_membership_update(update):
+            # Never shed: only the greeting below may wait or be dropped
+            lanes[PRIORITY_MODERATION].append(_MembershipStep(update))
+
+        if sum(map(len, lanes)) >= CHAT_QUEUE_LIMIT:
+            # Make room by shedding the oldest update of a less urgent class, if any
+            victim = next((p for p in reversed(PRIORITY_NAMES) if p > priority and lanes[p]), None)
+            if victim is None:
+                self._shed(update, priority, "overflow")
+                return
+            self._shed(lanes[victim].popleft(), victim, "overflow")
+        lanes[priority].append(update)
+
+    def _shed(self, update: object, priority: int, reason: str):
+        UPDATES_SHED.inc(reason, PRIORITY_NAMES[priority])
+        self.update_queue.task_done()
+
+    async def _run_membership_hooks(self, update: Update):
+        for callback in _membership_hooks:
+            try:
+                await callback(update)
+            except Exception as e:
+                logger.error(f"Membership hook {callback.__name__} failed: {e}")
+
+    async def _run_update(self, update: object, priority: int):
+        if is_stale(update, priority, time.time()):
+            self._shed(update, priority, "stale")
+            return
+        await self._slots.acquire(priority)
+        try:
+            await self.process_update(update)
+        finally:
+            self._slots.release()
+            self.update_queue.task_done()
+
+    async def _drain_chat(self, key: int):
+        """Run a chat's updates, most urgent class first, until its queue is empty"""
+        lanes = self._chat_queues[key]
+        try:
+            while True:
+                priority = next((p for p, lane in enumerate(lanes) if lane), None)
+                if priority is None:
+                    break
+                item = lanes[priority].popleft()
+                if isinstance(item, _MembershipStep):
+                    await self._run_membership_hooks(item.update)
+                else:
+                    await self._run_update(item, priority)
+        finally:
+            del self._chat_queues[key]
+            for lane in lanes:  # Only left over if this task was cancelled
+                for item in lane:
+                    if not isinstance(item, _MembershipStep):
+                        self.update_queue.task_done()
@@ -0,0 +1,113 @@
+import os
+import re
+import gzip
+import json
+import time
+import hashlib
+import logging
+from telegram import Update
+from utils.update_processor import register_arrival_hook
+
+logger = logging.getLogger(__name__)
+
+# Record every incoming update to this JSONL file (".gz" compresses); unset disables
+UPDATE_LOG_PATH = os.getenv("UPDATE_LOG_PATH", "")
+# Replace user IDs, names and @mentions with stable pseudonyms
+UPDATE_LOG_ANONYMIZE = os.getenv("UPDATE_LOG_ANONYMIZE", "true").lower() == "true"
+UPDATE_LOG_SALT = os.getenv("UPDATE_LOG_SALT", "")
+UPDATE_LOG_FLUSH_INTERVAL = 1.0
+
+MENTION_PATTERN = re.compile(r"@(\w{3,})")
+
+_log_file = None
+_last_flush = 0.0
+
+def _digest(value) -> int:
+    data = f"{UPDATE_LOG_SALT}:{value}".encode()
+    return int.from_bytes(hashlib.blake2b(data, digest_size=6).digest(), "big")
+
+def pseudonym_id(user_id: int) -> int:
+    """Stable fake ID; keeps the sign so group chat IDs stay negative"""
+    return (_digest(abs(user_id)) % 10**10 + 1) * (-1 if user_id < 0 else 1)
+
+def pseudonym_username(username: str) -> str:
+    return f"u{_digest(username.lower()) % 10**8:08d}"
+
+def anonymize(data):
+    """Pseudonymise users, private chats and @mentions inside a raw update dict"""
+    if isinstance(data, list):
+        return [anonymize(item) for item in data]
+    if not isinstance(data, dict):
+        return data
+
+    result = {key: anonymize(value) for key, value in data.items()}
+    if "is_bot" in result and "id" in result:  # User
+        result["id"] = pseudonym_id(result["id"])
+        result["first_name"] = f"User{result['id'] % 10000}"
+        result.pop("last_name", None)
+        if "username" in result:
+            result["username"] = pseudonym_username(result["username"])
+    elif result.get("type") == "private" and "id" in result:  # Private chat == user
+        result["id"] = pseudonym_id(result["id"])
+        for key in ("first_name", "last_name", "username"):
+            result.pop(key, None)
+    for key in ("text", "caption"):
+        if isinstance(result.get(key), str):
+            result[key] = MENTION_PATTERN.sub(
+                lambda match: "@" + pseudonym_username(match.group(1)), result[key]
+            )
+            # Rewritten text shifts offsets; keep only the leading bot command
+            entity_key = "entities" if key == "text" else "caption_entities"
+            if entity_key in result:
+                result[entity_key] = [
+                    entity for entity in result[entity_key]
+                    if entity.get("type") == "bot_command" and entity.get("offset") == 0
+                ]
+    return result
+
+def open_update_log(path: str):
+    global _log_file
+    opener = gzip.open if path.endswith(".gz") else open
+    _log_file = opener(path, "at", encoding="utf-8")
+    logger.info(f"Recording updates to {path}")
+
+def close_update_log():
+    global _log_file
+    if _log_file is not None:
+        _log_file.close()
+        _log_file = None
+
+def write_update(update: Update):
+    """Append the raw update with its arrival time"""
+    global _last_flush
+    if _log_file is None:
+        return
+    data = update.to_dict()
+    if UPDATE_LOG_ANONYMIZE:
+        data = anonymize(data)
+    # Format: {"t": arrival unix time, "u": raw update}
+    _log_file.write(json.dumps({"t": round(time.time(), 3), "u": data}, separators=(",", ":")) + "\n")
+    now = time.monotonic()
+    if now - _last_flush >= UPDATE_LOG_FLUSH_INTERVAL:
+        _log_file.flush()
+        _last_flush = now
+
+def read_update_log(path: str):
+    """Yield (arrival time, raw update) pairs from a recorded log"""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as log:
+        for line in log:
+            if line.strip():
+                entry = json.loads(line)
+                yield entry["t"], entry["u"]
+
+def setup_update_recorder(app):
+    """Record all updates when UPDATE_LOG_PATH is configured
+
+    Updates are written as ChatOrderedApplication fetches them, so shed ones
+    are logged too and "t" is the arrival time, as in the sharded dispatcher.
+    """
+    if not UPDATE_LOG_PATH:
+        return
+    open_update_log(UPDATE_LOG_PATH)
+    register_arrival_hook(write_update)